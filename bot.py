@@ -1,3 +1,4 @@
+import asyncio
 import json
 from datetime import time
 from zoneinfo import ZoneInfo
@@ -34,6 +35,7 @@ from features.logs_ui import (
     on_logs_refresh,
     on_menu_logs,
 )
+from features.mail_outbox import schedule_outbox_jobs
 from features.logs_excel import on_excel_export_dotdot, on_excel_export_rthk
 from features.help_ui import on_help_back_list, on_help_back_main, on_help_detail, on_menu_help
 from features.opslog_admin import on_opslog_push, on_opslog_push_today
@@ -58,6 +60,11 @@ from features.pr_processing import (
     on_settings_cancel_confirm,
     on_settings_confirm,
 )
+from integrations.gmail import fetch_logs_from_gmail
+from integrations.gmail_reports import fetch_report_emails
+from integrations.drive import precreate_drive_day_folders
+from integrations.google_api import preload_discovery_docs
+from integrations.logs_model import preload_logs_model
 from integrations.ops_log_archive import upload_ops_log_by_day
 
 
@@ -70,12 +77,39 @@ async def _daily_ops_log_archive_job(context):
         pass
 
 
+async def _logs_prefetch_job(context):
+    # 保持 logs store 与报告附件缓存是热的，打开 Logs / Excel 菜单时不用等网络
+    try:
+        await asyncio.to_thread(
+            fetch_logs_from_gmail,
+            days=config.LOGS_PREFETCH_DAYS,
+            max_results=config.LOGS_PREFETCH_MAX_RESULTS,
+        )
+    except Exception as e:
+        print(f"预取 logs 失败: {e}")
+    try:
+        await asyncio.to_thread(fetch_report_emails, list(config.REPORT_SOURCES), 24, 500)
+    except Exception as e:
+        print(f"预取报告邮件失败: {e}")
+
+
+async def _drive_folders_precreate_job(context):
+    # 午夜提前建好当天与次日的 根/YYYY/MMDD 目录，Drive 发送时只需查标题目录；
+    # 未启用/未使用过 Drive 时 precreate_drive_day_folders 直接跳过
+    try:
+        await asyncio.to_thread(precreate_drive_day_folders, 1)
+    except Exception as e:
+        print(f"预建 Drive 目录失败: {e}")
+
+
 def main():
     with open("config.json", "r", encoding="utf-8") as f:
         cfg = json.load(f)
     bot_token = cfg["telegram_token"]
 
     config.apply_runtime_config(cfg)
+    preload_discovery_docs()
+    preload_logs_model()
 
     app = ApplicationBuilder().token(bot_token).build()
 
@@ -88,6 +122,19 @@ def main():
         time=time(hour=0, minute=0, second=0, tzinfo=tz),
         name="opslog_archive_daily",
     )
+    app.job_queue.run_daily(
+        _drive_folders_precreate_job,
+        time=time(hour=0, minute=0, second=0, tzinfo=ZoneInfo("Asia/Hong_Kong")),
+        name="drive_folders_precreate",
+    )
+    app.job_queue.run_repeating(
+        _logs_prefetch_job,
+        interval=config.LOGS_PREFETCH_INTERVAL_SECONDS,
+        first=5,
+        name="logs_prefetch",
+    )
+    # 发送队列：恢复上次未完成的任务，并定期扫描到期重试
+    schedule_outbox_jobs(app)
 
     app.add_handler(MessageHandler(filters.Document.ALL | filters.PHOTO, handle_file))
     app.add_handler(CommandHandler("opslog_push", on_opslog_push))
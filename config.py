@@ -2,7 +2,8 @@ import os
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# 日志缓存文件路径
+# 日志缓存（SQLite）；旧版 JSON 缓存只在首次启动时迁移一次
+LOGS_DB_PATH = os.path.join(BASE_DIR, "logs_cache.db")
 LOGS_CACHE_PATH = os.path.join(BASE_DIR, "logs_cache.json")
 OPS_LOG_DIR = os.path.join(BASE_DIR, "logs")
 OPS_LOG_ARCHIVE_ENABLED = False
@@ -14,6 +15,13 @@ OPS_LOG_ARCHIVE_ADMIN_USER_IDS = []
 
 LOGS_PER_PAGE = 8
 LOGS_CACHE_TTL_SECONDS = 5 * 60
+# 后台预取：定期同步 logs（覆盖 Logs 瀏覽 的最大天数）并预拉当天报告附件，
+# 间隔应小于 LOGS_CACHE_TTL_SECONDS，保证打开菜单时缓存已是新的
+LOGS_PREFETCH_INTERVAL_SECONDS = 4 * 60
+LOGS_PREFETCH_DAYS = 7
+LOGS_PREFETCH_MAX_RESULTS = 500
+# 关键字在本地找不全时，每次向 Gmail 搜索拉取的条数
+LOGS_REMOTE_SEARCH_PAGE_SIZE = 50
 
 ERROR_TEXT = {
     100: "沒有找到附件",
@@ -46,6 +54,53 @@ USE_DRIVE_SHARE = False
 DRIVE_FOLDER_ID = None
 DRIVE_ROOT_FOLDER_NAME = "大批量图片"
 DRIVE_AUTO_SIZE_MB = 25
+# Drive 模式同时上传的文件数
+DRIVE_UPLOAD_CONCURRENCY = 4
+# Drive 上传：小文件单次 multipart 请求，超过阈值走分块 resumable（块大小需为 256KB 的整数倍）
+DRIVE_RESUMABLE_THRESHOLD_MB = 5
+DRIVE_UPLOAD_CHUNK_MB = 8
+# Drive 文件共享方式：inherit（继承文件夹权限）/ batch / per_file
+DRIVE_SHARING_STRATEGY = "inherit"
+# 根/年/日文件夹 id 的持久缓存（午夜任务会提前建好次日目录）
+DRIVE_FOLDER_CACHE_PATH = os.path.join(BASE_DIR, "cache", "drive_folders.json")
+DRIVE_FOLDER_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# 批量处理报告（Excel 导出）来源：按 subject 关键字 + Gmail 标签识别。
+# 新的批量来源只需在这里加一条。
+REPORT_SOURCES = {
+    "rthk": {
+        "subject_keyword": "RTHK Batch",
+        "label_name": "公關稿ai-logs",
+    },
+    "dotdot": {
+        "subject_keyword": "DotDot News Batch Processed",
+        "label_name": "公關稿ai-logs",
+    },
+}
+# 拉取报告邮件/附件的并发线程数
+REPORT_FETCH_WORKERS = 8
+# 已解析报告邮件在内存中保留的时长
+REPORT_RECORD_CACHE_HOURS = 48
+# 报告标签名 -> label id 的缓存有效期
+GMAIL_LABEL_CACHE_TTL_SECONDS = 6 * 60 * 60
+# 报告 JSON 附件的本地缓存（按最近使用淘汰）
+ATTACHMENT_CACHE_DIR = os.path.join(BASE_DIR, "cache", "attachments")
+ATTACHMENT_CACHE_MAX_MB = 64
+
+# 邮件原文超过该大小时用 resumable 分块上传发送（块大小需为 256KB 的整数倍）
+GMAIL_RESUMABLE_THRESHOLD_MB = 5
+GMAIL_UPLOAD_CHUNK_MB = 4
+
+# Gmail 配额限速（令牌桶）：每用户 250 单位/秒，留一点余量给其他客户端
+GMAIL_QUOTA_UNITS_PER_SECOND = 225
+GMAIL_QUOTA_BURST_UNITS = 250
+
+# 发送队列（outbox）：确认后先落盘，由后台任务发送并重试
+OUTBOX_DIR = os.path.join(BASE_DIR, "outbox")
+OUTBOX_WORKERS = 2
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_RETRY_BASE_SECONDS = 15
+OUTBOX_POLL_SECONDS = 30
 
 # Gmail subject 避免过长
 MAX_SUBJECT_LEN = 160
@@ -95,7 +150,8 @@ SESSION_TIMEOUT_SECONDS = 10 * 60
 
 def apply_runtime_config(config: dict) -> None:
     global TARGET_EMAIL
-    global USE_DRIVE_SHARE, DRIVE_FOLDER_ID, DRIVE_ROOT_FOLDER_NAME
+    global USE_DRIVE_SHARE, DRIVE_FOLDER_ID, DRIVE_ROOT_FOLDER_NAME, DRIVE_UPLOAD_CONCURRENCY
+    global DRIVE_SHARING_STRATEGY
     global PR_TEXT_DEBUG
     global OPS_LOG_ARCHIVE_ENABLED, OPS_LOG_ARCHIVE_BUCKET, OPS_LOG_ARCHIVE_PREFIX
     global OPS_LOG_ARCHIVE_TIMEZONE, OPS_LOG_ARCHIVE_CREDENTIALS_JSON
@@ -113,6 +169,10 @@ def apply_runtime_config(config: dict) -> None:
                 str(config.get("drive_root_folder_name")).strip()
                 or DRIVE_ROOT_FOLDER_NAME
             )
+        if isinstance(config, dict) and config.get("drive_upload_concurrency") is not None:
+            DRIVE_UPLOAD_CONCURRENCY = max(1, int(config.get("drive_upload_concurrency")))
+        if isinstance(config, dict) and config.get("drive_sharing_strategy"):
+            DRIVE_SHARING_STRATEGY = str(config.get("drive_sharing_strategy")).strip().lower()
         if isinstance(config, dict) and config.get("pr_text_debug") is not None:
             PR_TEXT_DEBUG = bool(config.get("pr_text_debug"))
         if isinstance(config, dict) and config.get("ops_log_archive_enabled") is not None:
@@ -44,6 +44,10 @@ def new_session_struct() -> Dict[str, Any]:
         # 长文本公关稿正文（发送邮件时写入正文）
         "pr_body_text": None,
         "pr_body_html": None,
+        # 公关稿邮件的预渲染结果（带指纹，见 features.pr_text_flow）
+        "email_prerender": None,
+        # Drive 批量上传断点（已上传文件与未完成的 resumable 会话，见 integrations.drive）
+        "drive_checkpoint": None,
     }
 
 
@@ -5,8 +5,8 @@ from telegram import Update
 import config
 from core.logging_ops import log_event
 from core.time_utils import now_hk
-from integrations.drive import _is_photo_name, get_drive_service, upload_files_to_drive
-from integrations.gmail import get_gmail_service, send_email_with_drive_links
+from integrations.drive import _is_photo_name, upload_files_to_drive
+from integrations.gmail import send_email_with_drive_links
 
 
 async def send_drive_mode(
@@ -23,10 +23,10 @@ async def send_drive_mode(
     pr_body_html: str | None,
     message_date,
     progress_update,
+    byte_progress=None,
 ):
     _progress_update = progress_update
     _progress_update("準備上傳到 Drive", 0)
-    drive_service = get_drive_service()
     dt = message_date.astimezone(now_hk().tzinfo)
     log_event(
         "drive_upload_attempt",
@@ -35,26 +35,36 @@ async def send_drive_mode(
         update=update,
         extra={"file_count": len(file_names)},
     )
+    # 断点记录在会话里：失败后重试只补传未完成的文件
+    checkpoint = session_data.get("drive_checkpoint")
+    if not isinstance(checkpoint, dict):
+        checkpoint = {}
+        session_data["drive_checkpoint"] = checkpoint
     ok, err, file_items = await asyncio.to_thread(
         upload_files_to_drive,
-        drive_service,
+        None,  # 在工作线程内取线程本地 Drive service
         list(file_paths),
         list(file_names),
         folder_id=config.DRIVE_FOLDER_ID,
         root_folder_name=config.DRIVE_ROOT_FOLDER_NAME,
         date_dt=dt,
         progress_cb=_progress_update,
+        byte_progress_cb=byte_progress,
+        checkpoint=checkpoint,
     )
     if not ok:
-        await query.edit_message_text(f"❌ Drive 上傳失敗，請重試。\n原因：{err}")
         log_event(
             "drive_upload_failed",
             session_key=session_key,
             session_id=session_data.get("session_id"),
             update=update,
-            extra={"error": err},
+            extra={
+                "error": err,
+                "uploaded_count": len(checkpoint.get("files") or {}),
+                "partial_count": len(checkpoint.get("partial") or {}),
+            },
         )
-        return False, err, None
+        return False, f"Drive 上傳失敗：{err}", None
     log_event(
         "drive_upload_success",
         session_key=session_key,
@@ -75,7 +85,7 @@ async def send_drive_mode(
     attach_names = [fn for _, fn in non_photo_files]
     success, err = await asyncio.to_thread(
         send_email_with_drive_links,
-        get_gmail_service(),
+        None,  # 在工作线程内取线程本地 Gmail service
         sender_info,
         (file_items or {}).get("items") or [],
         settings,
@@ -87,4 +97,6 @@ async def send_drive_mode(
         attachment_names=attach_names,
     )
     drive_folder_link = (file_items or {}).get("folder_link")
+    if success:
+        session_data["drive_checkpoint"] = None
     return success, err, drive_folder_link
@@ -12,7 +12,7 @@ from core.logging_ops import log_event
 from core.session import end_session, last_seen_fb_url, touch_session, user_sessions
 from features.pr_text_flow import maybe_process_pr_text
 from core.time_utils import now_hk
-from integrations.gmail import get_gmail_service, send_email_with_fb_url
+from integrations.gmail import send_email_with_fb_url
 from ui.keyboard import build_settings_keyboard
 from ui.messages import SESSION_EXPIRED_TEXT, try_edit_message_text_markup
 
@@ -249,9 +249,9 @@ async def on_fb_url_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     sender_info = _build_sender_info_from_message(query.message, fallback_user=query.from_user)
     settings = sd.get("settings") or {}
-    gmail_service = get_gmail_service()
+    # service 传 None：在工作线程内取线程本地 Gmail service
     success, err = await asyncio.to_thread(
-        send_email_with_fb_url, gmail_service, fb_url, sender_info, settings
+        send_email_with_fb_url, None, fb_url, sender_info, settings
     )
 
     if success:
@@ -385,12 +385,18 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyword_raw = (message.text or "").strip()
         keyword = "" if keyword_raw in ("-", "－") else keyword_raw
 
-        from features.logs_ui import render_logs_menu, set_logs_keyword
+        from features.logs_ui import load_remote_logs_if_needed, render_logs_menu, set_logs_keyword
 
         set_logs_keyword(context, session_key, keyword)
         sd["awaiting_logs_keyword"] = False
         user_sessions[session_key] = sd
 
+        # 本地缓存不够一页时，先向 Gmail 搜一页
+        try:
+            await load_remote_logs_if_needed(context, session_key, 0)
+        except Exception as e:
+            print(f"Gmail 關鍵字搜尋失敗: {e}")
+
         try:
             log_event(
                 "logs_keyword_set",
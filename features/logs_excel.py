@@ -11,7 +11,7 @@ from telegram.ext import ContextTypes
 from core.logging_ops import log_event
 from core.session import end_session, touch_session, user_sessions
 from core.time_utils import now_hk
-from integrations.gmail import fetch_dotdot_emails_for_excel, fetch_rthk_emails_for_excel
+from integrations.gmail_reports import fetch_dotdot_emails_for_excel, fetch_rthk_emails_for_excel
 from ui.messages import SESSION_EXPIRED_TEXT
 
 
@@ -1,6 +1,6 @@
 import asyncio
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from datetime import timedelta
+from typing import Any, Dict, Optional
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.error import BadRequest
@@ -10,7 +10,14 @@ import config
 from core.logging_ops import log_event
 from core.session import touch_session, user_sessions
 from core.time_utils import now_hk
-from integrations.gmail import fetch_logs_from_gmail, get_logs_cache_info, read_logs_cache
+from integrations.gmail import (
+    fetch_logs_from_gmail,
+    get_logs_cache_info,
+    hydrate_log_record,
+    log_record_needs_body,
+    search_logs_in_gmail,
+)
+from integrations.logs_model import get_log_record, query_logs_view
 from ui.messages import SESSION_EXPIRED_TEXT
 
 
@@ -27,32 +34,13 @@ def _normalize_keyword(keyword: Optional[str]) -> str:
     return (keyword or "").strip().lower()
 
 
-def _filter_logs(
-    logs: List[Dict[str, Any]], days: int, mode: str, keyword: Optional[str] = None
-) -> List[Dict[str, Any]]:
-    cutoff = now_hk() - timedelta(days=days)
-    kw = _normalize_keyword(keyword)
-    out = []
-    for x in logs:
-        try:
-            ts = datetime.fromisoformat(x.get("ts", ""))
-        except Exception:
-            continue
-        if ts < cutoff:
-            continue
-        st = (x.get("status") or "").upper()
-        if mode == "SUCCESS" and st != "SUCCESS":
-            continue
-        if mode == "ERROR" and st != "ERROR":
-            continue
-        if kw:
-            title = x.get("title") or ""
-            subject = x.get("subject") or ""
-            if kw not in f"{title} {subject}".lower():
-                continue
-        out.append(x)
-    out.sort(key=lambda r: r.get("ts", ""), reverse=True)
-    return out
+def _logs_query_args(view: Dict[str, Any]) -> Dict[str, Any]:
+    cutoff = now_hk() - timedelta(days=view["days"])
+    return {
+        "since_epoch": int(cutoff.timestamp()),
+        "mode": view["mode"],
+        "keyword": _normalize_keyword(view.get("keyword")),
+    }
 
 
 def _get_logs_view(context: ContextTypes.DEFAULT_TYPE, session_key: str) -> Dict[str, Any]:
@@ -66,9 +54,46 @@ def set_logs_keyword(context: ContextTypes.DEFAULT_TYPE, session_key: str, keywo
     view = _get_logs_view(context, session_key)
     view["keyword"] = (keyword or "").strip()
     view["page"] = 0
+    view["remote"] = None
     return view
 
 
+def _get_remote_state(view: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """当前关键字/天数对应的 Gmail 服务端搜索进度；条件变了就重新开始。"""
+    keyword = (view.get("keyword") or "").strip()
+    if not keyword:
+        return None
+    remote = view.get("remote")
+    if not remote or remote.get("keyword") != keyword or remote.get("days") != view["days"]:
+        remote = {"keyword": keyword, "days": view["days"], "page_token": None, "exhausted": False}
+        view["remote"] = remote
+    return remote
+
+
+async def load_remote_logs_if_needed(context: ContextTypes.DEFAULT_TYPE, session_key: str, page: int) -> Optional[int]:
+    """
+    关键字搜索时，本地结果不够显示第 page 页，就向 Gmail 搜索下一页并写入 store。
+    每次最多拉一页，返回新写入的记录数；不需要/已拉完时返回 None。
+    """
+    view = _get_logs_view(context, session_key)
+    remote = _get_remote_state(view)
+    if not remote or remote["exhausted"]:
+        return None
+    _, counts = query_logs_view(**_logs_query_args(view), limit=0)
+    if (page + 1) * config.LOGS_PER_PAGE <= counts["total"]:
+        return None
+    fetched, next_token = await asyncio.to_thread(
+        search_logs_in_gmail,
+        remote["keyword"],
+        remote["days"],
+        remote["page_token"],
+        config.LOGS_REMOTE_SEARCH_PAGE_SIZE,
+    )
+    remote["page_token"] = next_token
+    remote["exhausted"] = not next_token
+    return fetched
+
+
 def render_logs_menu(
     context: ContextTypes.DEFAULT_TYPE,
     session_key: str,
@@ -79,21 +104,20 @@ def render_logs_menu(
     days, mode, page = view["days"], view["mode"], view["page"]
     keyword = view.get("keyword") or ""
 
-    logs = read_logs_cache()
-    filtered = _filter_logs(logs, days=days, mode=mode, keyword=keyword)
-
-    succ = sum(1 for x in filtered if (x.get("status") or "").upper() == "SUCCESS")
-    fail = sum(1 for x in filtered if (x.get("status") or "").upper() == "ERROR")
+    # 计数查表、分页切片，都在预建索引上完成
+    query_args = _logs_query_args(view)
+    items, counts = query_logs_view(
+        **query_args, offset=page * config.LOGS_PER_PAGE, limit=config.LOGS_PER_PAGE
+    )
+    succ, fail, total = counts["succ"], counts["fail"], counts["total"]
 
-    total = len(filtered)
     max_page = max(0, (total - 1) // config.LOGS_PER_PAGE) if total else 0
     if page > max_page:
         page = max_page
         view["page"] = page
-
-    start = page * config.LOGS_PER_PAGE
-    end = start + config.LOGS_PER_PAGE
-    items = filtered[start:end]
+        items, _ = query_logs_view(
+            **query_args, offset=page * config.LOGS_PER_PAGE, limit=config.LOGS_PER_PAGE
+        )
 
     cache_info = cache_info or get_logs_cache_info()
     last_refresh = cache_info.get("last_refresh_ts") or "-"
@@ -109,7 +133,10 @@ def render_logs_menu(
         f"關鍵字: {keyword or '-'}",
         f"最後刷新: {last_refresh}  快取有效期: {ttl_minutes} 分鐘",
     ]
-    if total == 0:
+    remote = view.get("remote")
+    if keyword and remote and not remote.get("exhausted") and page >= max_page:
+        text_lines.append("Gmail 可能還有更早的結果，按 ➡️ 下一頁 繼續搜尋。")
+    elif total == 0:
         text_lines.append("暫無記錄，可點擊刷新。")
     text = "\n".join(text_lines)
 
@@ -220,6 +247,24 @@ async def on_menu_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
         pass
 
 
+_background_refresh_task: Optional[asyncio.Task] = None
+
+
+async def _background_refresh(days: int):
+    try:
+        await asyncio.to_thread(fetch_logs_from_gmail, days=days, max_results=200)
+    except Exception as e:
+        print(f"后台刷新 logs 失败: {e}")
+
+
+def _start_background_refresh(days: int) -> bool:
+    global _background_refresh_task
+    if _background_refresh_task is not None and not _background_refresh_task.done():
+        return False
+    _background_refresh_task = asyncio.create_task(_background_refresh(days))
+    return True
+
+
 async def on_logs_browse(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -238,21 +283,16 @@ async def on_logs_browse(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     view = _get_logs_view(context, session_key)
 
+    # 缓存由后台预取任务保持新鲜；万一过期也先显示现有数据，刷新放到后台
     cache_info = get_logs_cache_info()
-    logs = read_logs_cache()
     fetched = None
     auto_refreshed = False
-    if not logs or cache_info.get("stale"):
+    if cache_info.get("stale"):
+        auto_refreshed = _start_background_refresh(view["days"])
         try:
-            await query.answer("自動刷新中...", cache_time=0)
+            await query.answer("背景刷新中，稍後按 🔄 刷新 查看最新記錄。", cache_time=0)
         except BadRequest:
             pass
-        try:
-            fetched = await asyncio.to_thread(fetch_logs_from_gmail, days=view["days"], max_results=200)
-            auto_refreshed = True
-        except Exception:
-            fetched = None
-        cache_info = get_logs_cache_info()
 
     stats = await show_logs_menu(update, context, session_key, cache_info=cache_info)
     try:
@@ -452,13 +492,21 @@ async def on_logs_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message_id=query.message.message_id,
     )
     view = _get_logs_view(context, session_key)
-    logs = _filter_logs(
-        read_logs_cache(),
-        days=view["days"],
-        mode=view["mode"],
-        keyword=view.get("keyword"),
-    )
-    max_page = max(0, (len(logs) - 1) // config.LOGS_PER_PAGE)
+    fetched = None
+    if int(delta) > 0:
+        # 本地结果翻到底时，按需向 Gmail 多拉一页关键字结果
+        try:
+            fetched = await load_remote_logs_if_needed(
+                context, session_key, view["page"] + int(delta)
+            )
+        except Exception as e:
+            try:
+                await query.answer(f"Gmail 搜尋失敗: {e}", show_alert=True)
+            except BadRequest:
+                pass
+    _, counts = query_logs_view(**_logs_query_args(view), limit=0)
+    total = counts["total"]
+    max_page = max(0, (total - 1) // config.LOGS_PER_PAGE)
     view["page"] = min(max(0, view["page"] + int(delta)), max_page)
     stats = await show_logs_menu(update, context, session_key)
     try:
@@ -474,6 +522,7 @@ async def on_logs_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "result_count": stats.get("result_count"),
                 "keyword": stats.get("keyword"),
                 "delta": int(delta),
+                "remote_fetched": fetched,
             },
         )
     except Exception:
@@ -553,25 +602,33 @@ async def on_log_detail(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message_id=query.message.message_id,
     )
 
-    logs = read_logs_cache()
-    x = next((r for r in logs if str(r.get("id")) == str(log_id)), None)
+    x = get_log_record(log_id)
     if not x:
         await query.edit_message_text("⚠️ 記錄不存在或已過期。")
         return
 
+    # 列表只拉了 metadata；snippet 解析不出字段时才按需拉正文（结果会写回缓存）
+    if log_record_needs_body(x):
+        try:
+            x = await asyncio.to_thread(hydrate_log_record, log_id) or x
+        except Exception:
+            pass
+
     st = (x.get("status") or "").upper()
     code = x.get("error_code")
     err = config.ERROR_TEXT.get(int(code), "") if code is not None else ""
     ts = x.get("ts", "")
     subject = x.get("subject", "")
     title = x.get("title", "")
+    gmail_id = x.get("gmail_id") or "-"
 
     text = (
         "🧾 Log 詳情\n"
         f"時間: {ts}\n"
         f"狀態: {st}\n"
         f"錯誤碼: {code or '-'} {f'({err})' if err else ''}\n"
-        f"標題: {title}\n\n"
+        f"標題: {title}\n"
+        f"Gmail ID: {gmail_id}\n\n"
         f"Subject:\n{subject}"
     )
     keyboard = [[InlineKeyboardButton("⬅️ 返回列表", callback_data=f"logs_browse|{session_key}")]]
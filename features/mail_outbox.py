@@ -0,0 +1,323 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from telegram.ext import Application, ContextTypes
+
+import config
+from core.logging_ops import log_event
+from core.session import user_sessions
+from integrations.gmail import make_message_id, send_email_with_attachments, was_message_sent
+from ui.messages import try_edit_message_text
+
+# 发送队列：每个任务一个目录 outbox/<job_id>/，内含 job.json 与附件文件。
+# job_id 同时作为幂等键：写进邮件 Message-ID，重试前先查已发送邮件，避免重复发送。
+JOB_FILE = "job.json"
+
+_job_file_lock = threading.Lock()
+
+# 正在发送中的任务（进程内），防止多个 drain 同时处理同一任务
+_inflight: set = set()
+_inflight_tasks: set = set()
+_send_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _job_dir(job_id: str) -> str:
+    return os.path.join(config.OUTBOX_DIR, job_id)
+
+
+def _write_job(job: Dict[str, Any]) -> None:
+    """原子写入 job.json：先写临时文件再 os.replace，中途崩溃不会留下半截文件。"""
+    path = os.path.join(_job_dir(job["job_id"]), JOB_FILE)
+    tmp_path = f"{path}.tmp"
+    with _job_file_lock:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+def _read_job(job_id: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(_job_dir(job_id), JOB_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            job = json.load(f)
+        return job if isinstance(job, dict) else None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"读取发送任务失败: {job_id}, {e}")
+        return None
+
+
+def _remove_job(job_id: str) -> None:
+    shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+
+
+def _list_job_ids() -> List[str]:
+    try:
+        with os.scandir(config.OUTBOX_DIR) as it:
+            return sorted(e.name for e in it if e.is_dir())
+    except FileNotFoundError:
+        return []
+
+
+def enqueue_send(
+    *,
+    file_paths: List[str],
+    file_names: List[str],
+    sender_info: Dict[str, Any],
+    settings: Dict[str, Any],
+    pr_body_text: str,
+    pr_body_html: Optional[str],
+    chat_id: int,
+    message_id: int,
+    session_key: str,
+    session_id: Optional[str],
+    prerendered: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    把一次“確認傳送”落盘为发送任务，返回 job_id。
+    附件从 temp 目录移进任务目录，之后与会话生命周期无关（会话结束不会删掉它们）。
+    """
+    job_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:12]}"
+    job_dir = _job_dir(job_id)
+    os.makedirs(job_dir, exist_ok=True)
+
+    moved_paths = []
+    try:
+        for idx, fp in enumerate(file_paths):
+            # 加序号前缀，避免同名文件互相覆盖
+            dst = os.path.join(job_dir, f"{idx:03d}_{os.path.basename(fp)}")
+            shutil.move(fp, dst)
+            moved_paths.append(dst)
+
+        job = {
+            "job_id": job_id,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_ts": time.time(),
+            "last_error": None,
+            "created_ts": time.time(),
+            "file_paths": moved_paths,
+            "file_names": list(file_names),
+            "sender_info": sender_info,
+            "settings": settings,
+            "pr_body_text": pr_body_text,
+            "pr_body_html": pr_body_html,
+            "prerendered": prerendered,
+            "chat_id": chat_id,
+            "message_id": message_id,
+            "session_key": session_key,
+            "session_id": session_id,
+        }
+        _write_job(job)
+    except Exception:
+        # 落盘失败：把已移动的附件放回原处，交给调用方按发送失败处理
+        for src, dst in zip(file_paths, moved_paths):
+            try:
+                shutil.move(dst, src)
+            except Exception:
+                pass
+        _remove_job(job_id)
+        raise
+    return job_id
+
+
+def recover_outbox() -> int:
+    """
+    启动时调用：上次进程在发送中途退出的任务改回 pending，立即重试。
+    重试前会先按 Message-ID 查重。
+    """
+    count = 0
+    for job_id in _list_job_ids():
+        job = _read_job(job_id)
+        if not job:
+            continue
+        if job.get("status") == "sending":
+            job["status"] = "pending"
+            job["next_attempt_ts"] = time.time()
+            try:
+                _write_job(job)
+            except Exception as e:
+                print(f"恢复发送任务失败: {job_id}, {e}")
+                continue
+        count += 1
+    return count
+
+
+def _retry_delay_seconds(attempts: int) -> float:
+    # 指数退避：base, 2*base, 4*base ...，最长 30 分钟
+    return min(30 * 60, config.OUTBOX_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+
+
+def _deliver(job: Dict[str, Any]):
+    """在工作线程里执行：查重 + 发送，返回 (success, err)。"""
+    message_id = make_message_id(job["job_id"])
+    if int(job.get("attempts") or 0) > 1:
+        # 上次可能已经发出但没拿到响应（超时/进程退出），先查已发送邮件
+        try:
+            if was_message_sent(message_id):
+                return True, None
+        except Exception as e:
+            return False, f"查重失败: {e}"
+
+    return send_email_with_attachments(
+        None,  # 在工作线程内取线程本地 Gmail service
+        job.get("file_paths") or [],
+        job.get("sender_info") or {},
+        job.get("file_names") or [],
+        job.get("settings") or {},
+        job.get("pr_body_text") or "",
+        job.get("pr_body_html"),
+        message_id=message_id,
+        prerendered=job.get("prerendered"),
+    )
+
+
+async def _notify(application: Application, job: Dict[str, Any], text: str):
+    chat_id = job.get("chat_id")
+    message_id = job.get("message_id")
+    if chat_id is None or message_id is None:
+        return
+
+    # 原消息已被新会话当作操作 UI 复用时不覆盖它，改为回复一条新消息
+    session_data = user_sessions.get(job.get("session_key") or "")
+    if session_data and session_data.get("ui_message_id") == message_id:
+        try:
+            await application.bot.send_message(
+                chat_id=chat_id, text=text, reply_to_message_id=message_id
+            )
+        except Exception:
+            pass
+        return
+
+    await try_edit_message_text(application, int(chat_id), int(message_id), text)
+
+
+async def _process_job(application: Application, job_id: str):
+    global _send_semaphore
+    if _send_semaphore is None:
+        _send_semaphore = asyncio.Semaphore(max(1, int(config.OUTBOX_WORKERS or 1)))
+
+    try:
+        async with _send_semaphore:
+            job = _read_job(job_id)
+            if not job or job.get("status") not in ("pending", "sending"):
+                return
+
+            # 先记下尝试次数再发送：中途退出后，下一次尝试会先查重
+            job["status"] = "sending"
+            job["attempts"] = int(job.get("attempts") or 0) + 1
+            await asyncio.to_thread(_write_job, job)
+
+            try:
+                success, err = await asyncio.to_thread(_deliver, job)
+            except Exception as e:
+                success, err = False, str(e)
+
+            if success:
+                await asyncio.to_thread(_remove_job, job_id)
+                log_event(
+                    "send_success",
+                    session_key=job.get("session_key"),
+                    session_id=job.get("session_id"),
+                    extra={
+                        "job_id": job_id,
+                        "attempts": job["attempts"],
+                        "file_names": job.get("file_names") or [],
+                    },
+                )
+                await _notify(
+                    application,
+                    job,
+                    f"✅ 檔案已傳送到 {config.TARGET_EMAIL}",
+                )
+                return
+
+            job["last_error"] = err
+            if job["attempts"] >= config.OUTBOX_MAX_ATTEMPTS:
+                await asyncio.to_thread(_remove_job, job_id)
+                log_event(
+                    "send_failed",
+                    session_key=job.get("session_key"),
+                    session_id=job.get("session_id"),
+                    extra={"job_id": job_id, "attempts": job["attempts"], "error": err},
+                )
+                await _notify(
+                    application,
+                    job,
+                    f"❌ 傳送失敗（已重試 {job['attempts']} 次），請重新上傳後再試。",
+                )
+                return
+
+            delay = _retry_delay_seconds(job["attempts"])
+            job["status"] = "pending"
+            job["next_attempt_ts"] = time.time() + delay
+            await asyncio.to_thread(_write_job, job)
+            log_event(
+                "send_retry_scheduled",
+                session_key=job.get("session_key"),
+                session_id=job.get("session_id"),
+                extra={
+                    "job_id": job_id,
+                    "attempts": job["attempts"],
+                    "delay_seconds": delay,
+                    "error": err,
+                },
+            )
+            try:
+                application.job_queue.run_once(_outbox_drain_job, when=delay)
+            except Exception:
+                pass
+    except Exception as e:
+        print(f"处理发送任务失败: {job_id}, {e}")
+    finally:
+        _inflight.discard(job_id)
+
+
+async def drain_outbox(application: Application):
+    """扫描 outbox，把到期的 pending 任务交给后台发送（并发数受 OUTBOX_WORKERS 限制）。"""
+    now = time.time()
+    job_ids = await asyncio.to_thread(_list_job_ids)
+    for job_id in job_ids:
+        if job_id in _inflight:
+            continue
+        job = await asyncio.to_thread(_read_job, job_id)
+        # 不在 _inflight 里的 sending 任务是被异常中断的，一并重试
+        if not job or job.get("status") not in ("pending", "sending"):
+            continue
+        if float(job.get("next_attempt_ts") or 0) > now:
+            continue
+        _inflight.add(job_id)
+        task = asyncio.create_task(_process_job(application, job_id))
+        _inflight_tasks.add(task)
+        task.add_done_callback(_inflight_tasks.discard)
+
+
+async def _outbox_drain_job(context: ContextTypes.DEFAULT_TYPE):
+    await drain_outbox(context.application)
+
+
+def kick_outbox(application: Application):
+    """入队后立即触发一次 drain，不必等轮询周期。"""
+    try:
+        application.job_queue.run_once(_outbox_drain_job, when=0)
+    except Exception as e:
+        print(f"触发发送队列失败: {e}")
+
+
+def schedule_outbox_jobs(application: Application):
+    recovered = recover_outbox()
+    if recovered:
+        print(f"发送队列中有 {recovered} 个待发送任务")
+    application.job_queue.run_repeating(
+        _outbox_drain_job,
+        interval=config.OUTBOX_POLL_SECONDS,
+        first=1,
+        name="mail_outbox_drain",
+    )
@@ -19,14 +19,14 @@ from features.fb_url import (
     _looks_like_facebook_url,
     _normalize_fb_url,
 )
-from features.pr_text_flow import maybe_process_pr_text
+from features.mail_outbox import enqueue_send, kick_outbox
+from features.pr_text_flow import maybe_process_pr_text, schedule_email_prerender
 from integrations.drive import (
     _format_size,
     _has_non_photo,
     _make_unique_filename,
     _total_size_bytes,
 )
-from integrations.gmail import get_gmail_service, send_email_with_attachments
 from ui.keyboard import build_settings_keyboard
 from ui.messages import (
     SESSION_EXPIRED_TEXT,
@@ -150,6 +150,7 @@ async def _complete_add_msg(
     session_data["add_msg_done"] = True
     session_data["add_msg_done_job"] = None
     session_data["add_msg_done_task"] = None
+    schedule_email_prerender(session_key)
 
     ui_chat_id = session_data.get("ui_chat_id")
     ui_message_id = session_data.get("ui_message_id")
@@ -527,6 +528,7 @@ async def on_settings_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE
     ].copy()
 
     del context.user_data[f"temp_settings_{session_key}"]
+    schedule_email_prerender(session_key)
 
     log_event(
         "settings_confirm",
@@ -947,6 +949,7 @@ async def on_do_del_one(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pass
         files.pop(index)
         user_sessions[session_key]["files"] = files
+        schedule_email_prerender(session_key)
 
         try:
             log_event(
@@ -1029,6 +1032,7 @@ async def on_do_del_pr_body(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if session_data.get("pr_body_text"):
         session_data["pr_body_text"] = None
         session_data["pr_body_html"] = None
+        session_data["email_prerender"] = None
         user_sessions[session_key] = session_data
 
         try:
@@ -1187,6 +1191,9 @@ async def on_confirm_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     total_units = (2 + (len(file_names) * 2) + 1) if drive_mode else 3
     done_units = 0
+    # Drive 模式下每个文件的“上传”这一单位按实际上传字节折算
+    upload_units = len(file_names) if drive_mode else 0
+    uploaded_ratio = 0.0
 
     progress_active = True
     progress_state = {"percent": 0, "status": "準備附件", "dirty": True}
@@ -1211,11 +1218,19 @@ async def on_confirm_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         if inc:
             done_units = min(total_units, done_units + inc)
-        percent = int(round((done_units / total_units) * 100)) if total_units else 0
+        units = done_units + uploaded_ratio * upload_units
+        percent = min(100, int(round((units / total_units) * 100))) if total_units else 0
         progress_state["percent"] = percent
         progress_state["status"] = status
         progress_state["dirty"] = True
 
+    def _progress_bytes(uploaded: int, total: int):
+        nonlocal uploaded_ratio
+        if not progress_active:
+            return
+        uploaded_ratio = (uploaded / total) if total else 1.0
+        _progress_update(f"上傳中 {_format_size(uploaded)} / {_format_size(total)}", 0)
+
     _progress_update("準備附件", 0)
 
     sender_info = {
@@ -1226,8 +1241,6 @@ async def on_confirm_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "date": message.date.astimezone(now_hk().tzinfo).strftime("%Y-%m-%d %H:%M:%S"),
     }
 
-    gmail_service = get_gmail_service()
-
     log_event(
         "send_attempt",
         session_key=session_key,
@@ -1253,27 +1266,106 @@ async def on_confirm_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pr_body_html=pr_body_html,
             message_date=message.date,
             progress_update=_progress_update,
+            byte_progress=_progress_bytes,
         )
         if not success:
+            progress_active = False
+            try:
+                progress_task.cancel()
+            except Exception:
+                pass
+            session_data["sending"] = False
+            # 附件放回会话；已上传到 Drive 的部分记在 drive_checkpoint，重试时跳过
+            if sending_snapshot:
+                session_data["files"] = sending_snapshot + (session_data.get("files") or [])
+            session_data["sending_snapshot"] = []
+            await try_edit_query_message(
+                query,
+                f"❌ 傳送失敗，請重試。\n原因：{err}\n已上傳到 Drive 的檔案會保留，重試時從中斷處繼續。",
+            )
+            log_event(
+                "send_failed",
+                session_key=session_key,
+                session_id=session_data.get("session_id"),
+                update=update,
+                extra={"error": err, "drive_mode": True},
+            )
             return
     else:
-        _progress_update("打包附件", 1)
-        _progress_update("傳送郵件", 1)
-        success, err = await asyncio.to_thread(
-            send_email_with_attachments,
-            gmail_service,
-            file_paths,
-            sender_info,
-            file_names,
-            settings,
-            pr_body_text,
-            pr_body_html,
-        )
+        # 非 Drive 模式：落盘进发送队列后立即返回，由后台任务发送并更新此訊息
+        _progress_update("加入發送佇列", 1)
+        try:
+            job_id = await asyncio.to_thread(
+                enqueue_send,
+                file_paths=list(file_paths),
+                file_names=list(file_names),
+                sender_info=sender_info,
+                settings=dict(settings),
+                pr_body_text=pr_body_text,
+                pr_body_html=pr_body_html,
+                chat_id=query.message.chat.id,
+                message_id=query.message.message_id,
+                session_key=session_key,
+                session_id=session_data.get("session_id"),
+                prerendered=session_data.get("email_prerender"),
+            )
+            success, err = True, None
+        except Exception as e:
+            job_id = None
+            success, err = False, str(e)
         drive_folder_link = None
 
+        progress_active = False
+        try:
+            progress_task.cancel()
+        except Exception:
+            pass
+        session_data["sending"] = False
+
+        if success:
+            # 附件已移入 outbox，不再属于会话
+            session_data["sending_snapshot"] = []
+            log_event(
+                "send_queued",
+                session_key=session_key,
+                session_id=session_data.get("session_id"),
+                update=update,
+                extra={"job_id": job_id, "file_count": len(file_names)},
+            )
+            kick_outbox(context.application)
+            if session_data.get("files"):
+                await try_edit_query_message(
+                    query,
+                    "📤 本批已加入發送佇列，傳送完成後會更新此訊息。\n偵測到新增附件，已保留在列表中，請繼續傳送。",
+                )
+                await handle_mention(update, context)
+            else:
+                await end_session(
+                    application=context.application,
+                    session_key=session_key,
+                    reason_text="📤 已加入發送佇列，傳送完成後會更新此訊息。\n會話結束。",
+                    reason_code="send_queued",
+                    user_id=query.from_user.id,
+                    chat_id=query.message.chat.id,
+                    message_id=query.message.message_id,
+                )
+        else:
+            await query.edit_message_text("❌ 傳送失敗，請重試")
+            if sending_snapshot:
+                session_data["files"] = sending_snapshot + (session_data.get("files") or [])
+            session_data["sending_snapshot"] = []
+            log_event(
+                "send_failed",
+                session_key=session_key,
+                session_id=session_data.get("session_id"),
+                update=update,
+                extra={"error": err},
+            )
+        return
+
     if success:
         extra_link = ""
-        if drive_mode and drive_folder_link:
+        if drive_folder_link:
             extra_link = f"\n\nDrive 資料夾：\n{drive_folder_link}"
         done_units = total_units
         _progress_update("傳送完成", 0)
@@ -1306,24 +1398,6 @@ async def on_confirm_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 chat_id=query.message.chat.id,
                 message_id=query.message.message_id,
             )
-    else:
-        progress_active = False
-        try:
-            progress_task.cancel()
-        except Exception:
-            pass
-        await query.edit_message_text("❌ 傳送失敗，請重試")
-        if sending_snapshot:
-            session_data["files"] = sending_snapshot + (session_data.get("files") or [])
-        session_data["sending_snapshot"] = []
-        session_data["sending"] = False
-        log_event(
-            "send_failed",
-            session_key=session_key,
-            session_id=session_data.get("session_id"),
-            update=update,
-            extra={"error": err},
-        )
 
 
 async def on_end_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1,3 +1,4 @@
+import asyncio
 from typing import Optional
 
 from telegram import Update
@@ -7,6 +8,10 @@ import config
 from core.logging_ops import log_event
 from core.session import new_session_struct, touch_session, user_sessions
 from features.pr_text_detect import analyze_pr_text
+from integrations.gmail import _attachment_email_fingerprint, prerender_attachment_email
+
+# 后台预渲染任务的引用，避免 task 在完成前被回收
+_prerender_tasks: set = set()
 
 
 def _ensure_session(update: Update, *, session_key: str):
@@ -21,6 +26,48 @@ def _ensure_session(update: Update, *, session_key: str):
     )
 
 
+def _prerender_inputs(sd: dict) -> tuple:
+    file_names = [name for _, name in (sd.get("files") or [])]
+    settings = dict(sd.get("settings") or {})
+    pr_body_text = (sd.get("pr_body_text") or "").strip()
+    pr_body_html = (sd.get("pr_body_html") or "").strip() or None
+    return file_names, settings, pr_body_text, pr_body_html
+
+
+async def _prerender_email(session_key: str):
+    sd = user_sessions.get(session_key)
+    if not sd:
+        return
+    inputs = _prerender_inputs(sd)
+    try:
+        result = await asyncio.to_thread(prerender_attachment_email, *inputs)
+    except Exception as e:
+        print(f"预渲染邮件失败: {e}")
+        return
+    sd = user_sessions.get(session_key)
+    if not sd:
+        return
+    # 渲染期间正文/设置/附件可能又变了：只保留与当前会话一致的结果
+    if result.get("fingerprint") == _attachment_email_fingerprint(*_prerender_inputs(sd)):
+        sd["email_prerender"] = result
+
+
+def schedule_email_prerender(session_key: str) -> None:
+    """
+    会话里有公关稿正文时，在后台预先渲染邮件主题与正文 HTML，
+    确认发送时只需拼装附件。正文、设置或附件列表变化后调用一次即可刷新。
+    """
+    sd = user_sessions.get(session_key)
+    if not sd:
+        return
+    sd["email_prerender"] = None
+    if not (sd.get("pr_body_text") or "").strip():
+        return
+    task = asyncio.create_task(_prerender_email(session_key))
+    _prerender_tasks.add(task)
+    task.add_done_callback(_prerender_tasks.discard)
+
+
 async def maybe_process_pr_text(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
@@ -78,6 +125,7 @@ async def maybe_process_pr_text(
     sd["pr_body_text"] = pr_body_text
     sd["pr_body_html"] = (rich_html or "").strip() or None
     user_sessions[session_key] = sd
+    schedule_email_prerender(session_key)
 
     log_event(
         "pr_text_detected_auto",
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Optional
+
+import config
+
+# 同一进程内串行化写入与淘汰
+_cache_lock = threading.Lock()
+
+
+def _cache_path(message_id: str, part_key: str) -> str:
+    digest = hashlib.sha256(f"{message_id}:{part_key}".encode("utf-8")).hexdigest()
+    return os.path.join(config.ATTACHMENT_CACHE_DIR, f"{digest}.json")
+
+
+def get_cached_json(message_id: str, part_key: str) -> Optional[Any]:
+    """
+    读取已缓存的 JSON 附件；没有缓存返回 None。
+    命中时刷新文件 mtime，作为 LRU 淘汰依据。
+    """
+    if not message_id or not part_key:
+        return None
+    path = _cache_path(message_id, part_key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # 文件损坏：删掉，按未命中处理
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+        return None
+    try:
+        os.utime(path, None)
+    except Exception:
+        pass
+    return data
+
+
+def put_cached_json(message_id: str, part_key: str, data: Any) -> None:
+    """写入 JSON 附件缓存（紧凑格式），然后按总大小淘汰最久未用的文件。"""
+    if not message_id or not part_key or data is None:
+        return
+    path = _cache_path(message_id, part_key)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(config.ATTACHMENT_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"写入附件缓存失败: {message_id}, {e}")
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+        return
+    _evict_if_needed()
+
+
+def _evict_if_needed() -> None:
+    max_bytes = int(config.ATTACHMENT_CACHE_MAX_MB * 1024 * 1024)
+    with _cache_lock:
+        entries = []
+        total = 0
+        try:
+            with os.scandir(config.ATTACHMENT_CACHE_DIR) as it:
+                for entry in it:
+                    if not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        except FileNotFoundError:
+            return
+
+        if total <= max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except Exception:
+                pass
@@ -1,46 +1,58 @@
-import json
 import os
+import threading
 import time
-from datetime import datetime
-from typing import List, Optional
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 
 import config
 from core.time_utils import now_hk
-from integrations.gmail import get_google_creds
+from integrations.drive_folder_cache import (
+    folder_needs_verification,
+    get_cached_folder_id,
+    has_cached_folders,
+    invalidate_folder_ids,
+    mark_folder_verified,
+    put_cached_folder_id,
+)
+from integrations.google_api import _format_gapi_error, _is_retryable_gapi_error, get_service
+
+
+# 文件共享方式（config.DRIVE_SHARING_STRATEGY）：
+# - inherit：依赖标题文件夹的“任何人可读”继承，只抽查一个文件
+# - batch：上传完成后用一个 batch 请求给所有文件设权限
+# - per_file：每个文件单独设权限（旧行为）
+DRIVE_SHARING_STRATEGIES = ("inherit", "batch", "per_file")
+# Drive batch 接口单次最多 100 个子请求
+DRIVE_BATCH_MAX_SIZE = 100
+ANYONE_READER_PERMISSION = {"type": "anyone", "role": "reader"}
+_MB = 1024 * 1024
+
+# 上传用的常驻线程池：线程长期存活，线程本地的 Drive service/连接可以跨批次复用
+_upload_pool: Optional[ThreadPoolExecutor] = None
+_upload_pool_size = 0
+_upload_pool_lock = threading.Lock()
+
+
+def _get_upload_pool() -> ThreadPoolExecutor:
+    global _upload_pool, _upload_pool_size
+    workers = max(1, int(config.DRIVE_UPLOAD_CONCURRENCY or 1))
+    with _upload_pool_lock:
+        if _upload_pool is None or _upload_pool_size != workers:
+            # 配置变了才重建；旧池里正在跑的任务照常完成
+            if _upload_pool is not None:
+                _upload_pool.shutdown(wait=False)
+            _upload_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="drive-upload")
+            _upload_pool_size = workers
+        return _upload_pool
 
 
 def get_drive_service():
-    return build("drive", "v3", credentials=get_google_creds())
-
-
-def _format_gapi_error(e: Exception) -> str:
-    if isinstance(e, HttpError):
-        try:
-            payload = json.loads(e.content.decode("utf-8", errors="ignore"))
-            msg = payload.get("error", {}).get("message") or str(e)
-        except Exception:
-            msg = str(e)
-        return f"HTTP {getattr(e.resp, 'status', 'unknown')}: {msg}"
-    return str(e)
-
-
-def _is_retryable_gapi_error(e: Exception) -> bool:
-    if isinstance(e, HttpError):
-        status = getattr(e.resp, "status", None)
-        if status in (429, 500, 502, 503, 504):
-            return True
-        try:
-            payload = json.loads(e.content.decode("utf-8", errors="ignore"))
-            msg = (payload.get("error", {}).get("message") or "").lower()
-            if "transient" in msg or "backend error" in msg:
-                return True
-        except Exception:
-            pass
-    return False
+    # 线程本地 service：请在实际调用 API 的工作线程里获取
+    return get_service("drive", "v3")
 
 
 def _execute_with_retry(fn, *, max_attempts: int = 4, base_sleep: float = 1.0):
@@ -121,8 +133,12 @@ def _make_unique_filename(file_name: str, existing_names: List[str]) -> str:
         i += 1
 
 
-def ensure_drive_folder(service, name: str, parent_id: str) -> str:
+def ensure_drive_folder(service, name: str, parent_id: str, *, use_cache: bool = False) -> str:
     safe_name = _sanitize_drive_folder_name(name)
+    if use_cache:
+        cached = get_cached_folder_id(parent_id, safe_name)
+        if cached and _cached_folder_usable(service, cached):
+            return cached
     q = (
         "mimeType='application/vnd.google-apps.folder' "
         f"and name='{_escape_drive_query_value(safe_name)}' "
@@ -133,7 +149,37 @@ def ensure_drive_folder(service, name: str, parent_id: str) -> str:
     )
     files = resp.get("files", []) or []
     if files:
-        return files[0].get("id")
+        folder_id = files[0].get("id")
+    else:
+        folder_id = _create_drive_folder(service, safe_name, parent_id)
+    if use_cache:
+        put_cached_folder_id(parent_id, safe_name, folder_id)
+    return folder_id
+
+
+def _cached_folder_usable(service, folder_id: str) -> bool:
+    """
+    缓存的文件夹 id 每天复查一次是否已进回收站（进回收站不会 404，
+    继续往里上传会让分享链接失效）。不可用时清掉缓存，由调用方重新查找。
+    """
+    if not folder_needs_verification(folder_id):
+        return True
+    try:
+        meta = _execute_with_retry(
+            lambda: service.files().get(fileId=folder_id, fields="id,trashed").execute()
+        )
+    except Exception as e:
+        if not _is_not_found_error(e):
+            raise
+        meta = None
+    if not meta or meta.get("trashed"):
+        invalidate_folder_ids([folder_id])
+        return False
+    mark_folder_verified(folder_id)
+    return True
+
+
+def _create_drive_folder(service, safe_name: str, parent_id: str) -> str:
     created = _execute_with_retry(
         lambda: service.files().create(
             body={
@@ -147,6 +193,173 @@ def ensure_drive_folder(service, name: str, parent_id: str) -> str:
     return created.get("id")
 
 
+def _is_not_found_error(e: Exception) -> bool:
+    return isinstance(e, HttpError) and getattr(e.resp, "status", None) == 404
+
+
+def ensure_drive_day_folder(
+    service,
+    dt: datetime,
+    *,
+    folder_id=None,
+    root_folder_name: str = config.DRIVE_ROOT_FOLDER_NAME,
+) -> Tuple[str, List[str]]:
+    """
+    根/YYYY/MMDD 三级目录走持久缓存，通常不需要任何 API 调用。
+    返回 (日目录 id, 途经的各级目录 id)，后者供调用方在 404 时失效缓存。
+    """
+    root_id = ensure_drive_folder(service, root_folder_name, folder_id or "root", use_cache=True)
+    year_id = ensure_drive_folder(service, dt.strftime("%Y"), root_id, use_cache=True)
+    day_id = ensure_drive_folder(service, dt.strftime("%m%d"), year_id, use_cache=True)
+    return day_id, [root_id, year_id, day_id]
+
+
+def precreate_drive_day_folders(days_ahead: int = 1) -> List[str]:
+    """
+    提前建好今天起 days_ahead 天内的日目录并写入缓存（午夜定时任务调用）。
+    没开 Drive 分享、也从没用过 Drive 模式（缓存为空）时什么都不做，避免留下空文件夹。
+    """
+    if not (config.USE_DRIVE_SHARE or has_cached_folders()):
+        return []
+    service = get_drive_service()
+    today = now_hk()
+    created = []
+    for offset in range(days_ahead + 1):
+        day_id, _ = ensure_drive_day_folder(
+            service,
+            today + timedelta(days=offset),
+            folder_id=config.DRIVE_FOLDER_ID,
+            root_folder_name=config.DRIVE_ROOT_FOLDER_NAME,
+        )
+        created.append(day_id)
+    return created
+
+
+def _upload_file(
+    service,
+    file_path: str,
+    metadata: dict,
+    on_bytes,
+    *,
+    resume: Optional[dict] = None,
+    on_session=None,
+) -> dict:
+    """
+    小文件用一次 multipart 请求上传（省掉 resumable 建会话的往返）；
+    超过 DRIVE_RESUMABLE_THRESHOLD_MB 的分块 resumable 上传，每块回调 on_bytes(增量字节)。
+    - resume: 上次中断留下的 {"uri": ...}，从服务器已收到的字节继续
+    - on_session(uri, progress): 每块上传后回调，供调用方记录断点
+    """
+    size = os.path.getsize(file_path)
+    fields = "id,webViewLink"
+    if size <= config.DRIVE_RESUMABLE_THRESHOLD_MB * _MB:
+        media = MediaFileUpload(file_path, resumable=False)
+        created = _execute_with_retry(
+            lambda: service.files().create(
+                body=metadata,
+                media_body=media,
+                fields=fields,
+            ).execute()
+        )
+        on_bytes(size)
+        return created
+
+    media = MediaFileUpload(
+        file_path, chunksize=config.DRIVE_UPLOAD_CHUNK_MB * _MB, resumable=True
+    )
+    request = service.files().create(body=metadata, media_body=media, fields=fields)
+    resume_uri = (resume or {}).get("uri")
+    if resume_uri:
+        # 复用上次的上传会话：标记为出错状态，下一次 next_chunk 会先查询服务器已收到的字节
+        request.resumable_uri = resume_uri
+        request._in_error_state = True
+    sent = 0
+    created = None
+    try:
+        while created is None:
+            # next_chunk 出错后再次调用会先向服务器查询已收到的字节，从断点继续
+            status, created = _execute_with_retry(request.next_chunk)
+            if status is not None:
+                on_bytes(status.resumable_progress - sent)
+                sent = status.resumable_progress
+            if on_session and created is None and request.resumable_uri:
+                on_session(request.resumable_uri, sent)
+    except HttpError as e:
+        # 上传会话已过期/失效：丢掉断点，从头上传
+        if resume_uri and getattr(e.resp, "status", None) in (404, 410):
+            if on_session:
+                on_session(None, 0)
+            return _upload_file(service, file_path, metadata, on_bytes, on_session=on_session)
+        raise
+    on_bytes(size - sent)
+    return created
+
+
+def _share_anyone_reader(service, file_id: str) -> None:
+    _execute_with_retry(
+        lambda: service.permissions().create(
+            fileId=file_id,
+            body=dict(ANYONE_READER_PERMISSION),
+        ).execute()
+    )
+
+
+def _has_anyone_reader(service, file_id: str) -> bool:
+    resp = _execute_with_retry(
+        lambda: service.permissions().list(
+            fileId=file_id,
+            fields="permissions(type,role)",
+        ).execute()
+    )
+    return any(
+        p.get("type") == "anyone" and p.get("role") in ("reader", "commenter", "writer")
+        for p in (resp.get("permissions") or [])
+    )
+
+
+def _share_files_batch(service, file_ids: List[str]) -> None:
+    """一次 batch 请求设置多个文件的权限；批内失败的子请求再逐个重试。"""
+    shared = set()
+    failed = []
+
+    def _on_item(request_id, response, exception):
+        if exception is None:
+            shared.add(request_id)
+        else:
+            failed.append(request_id)
+
+    for start in range(0, len(file_ids), DRIVE_BATCH_MAX_SIZE):
+        chunk = file_ids[start : start + DRIVE_BATCH_MAX_SIZE]
+        batch = service.new_batch_http_request(callback=_on_item)
+        for file_id in chunk:
+            batch.add(
+                service.permissions().create(
+                    fileId=file_id,
+                    body=dict(ANYONE_READER_PERMISSION),
+                ),
+                request_id=file_id,
+            )
+        try:
+            batch.execute()
+        except Exception as e:
+            # 整个 batch 请求失败：没拿到结果的条目改为逐个设置
+            if not _is_retryable_gapi_error(e):
+                raise
+            failed.extend(f for f in chunk if f not in shared and f not in failed)
+
+    for file_id in failed:
+        _share_anyone_reader(service, file_id)
+
+
+def _share_uploaded_files(service, file_ids: List[str], strategy: str) -> None:
+    if strategy == "inherit":
+        # 标题文件夹已设为任何人可读，新文件应继承；抽查一个，未继承再整批补设
+        if _has_anyone_reader(service, file_ids[0]):
+            return
+        print("Drive 文件未继承文件夹共享权限，改为批量设置")
+    _share_files_batch(service, file_ids)
+
+
 def upload_files_to_drive(
     service,
     file_paths,
@@ -155,67 +368,150 @@ def upload_files_to_drive(
     root_folder_name: str = config.DRIVE_ROOT_FOLDER_NAME,
     date_dt: Optional[datetime] = None,
     progress_cb=None,
+    byte_progress_cb=None,
+    checkpoint: Optional[dict] = None,
 ):
+    """
+    progress_cb(status, inc) 报告步骤；提供 byte_progress_cb(uploaded, total) 时，
+    上传本身按字节报告（分块上传每块回调一次），上传完成不再按文件 +1。
+    checkpoint 为调用方持有的 dict（如会话里的 drive_checkpoint），原地记录已上传文件
+    和未完成的 resumable 会话；失败后用同一个 dict 重试，只补传剩下的部分。
+    """
     # 目录结构：根/大批量图片/YYYY/MMDD/文章标题
+    service = service or get_drive_service()
     dt = date_dt or now_hk()
-    year = dt.strftime("%Y")
-    mmdd = dt.strftime("%m%d")
     title = _pick_attachment_title(file_names)
 
     try:
         if progress_cb:
             progress_cb("查找/建立 Drive 資料夾", 0)
-        base_parent = folder_id or "root"
-        root_id = ensure_drive_folder(service, root_folder_name, base_parent)
-        year_id = ensure_drive_folder(service, year, root_id)
-        day_id = ensure_drive_folder(service, mmdd, year_id)
-        title_id = ensure_drive_folder(service, title, day_id)
+        day_id, path_ids = ensure_drive_day_folder(
+            service, dt, folder_id=folder_id, root_folder_name=root_folder_name
+        )
+        try:
+            title_id = ensure_drive_folder(service, title, day_id)
+        except Exception as e:
+            # 缓存的上级目录已被删除/移走：清掉缓存，重新查找一次
+            if not _is_not_found_error(e):
+                raise
+            invalidate_folder_ids(path_ids)
+            day_id, path_ids = ensure_drive_day_folder(
+                service, dt, folder_id=folder_id, root_folder_name=root_folder_name
+            )
+            title_id = ensure_drive_folder(service, title, day_id)
 
         # 设文件夹为任何人可读
         if progress_cb:
             progress_cb("設定 Drive 資料夾權限", 0)
-        _execute_with_retry(
-            lambda: service.permissions().create(
-                fileId=title_id,
-                body={"type": "anyone", "role": "reader"},
-            ).execute()
-        )
+        _share_anyone_reader(service, title_id)
         if progress_cb:
             progress_cb("Drive 資料夾已就緒", 2)
     except Exception as e:
         return False, _format_gapi_error(e), None
 
-    items = []
-    for file_path, file_name in zip(file_paths, file_names):
+    if checkpoint is None:
+        checkpoint = {}
+    if checkpoint.get("folder_id") != title_id:
+        # 标题/日期变了，目标文件夹不同：之前的断点作废
+        checkpoint.clear()
+        checkpoint.update({"folder_id": title_id, "files": {}, "partial": {}})
+    done_files = checkpoint["files"]
+    partial = checkpoint["partial"]
+
+    # 多个工作线程会同时回调进度：串行化，调用方的进度状态不用自己加锁
+    progress_lock = threading.Lock()
+
+    def _progress(status: str, inc: int = 0):
+        if progress_cb:
+            with progress_lock:
+                progress_cb(status, inc)
+
+    total_bytes = _total_size_bytes(list(zip(file_paths, file_names)))
+    uploaded_bytes = 0
+
+    def _progress_bytes(delta: int):
+        nonlocal uploaded_bytes
+        if not byte_progress_cb or delta <= 0:
+            return
+        with progress_lock:
+            uploaded_bytes += delta
+            byte_progress_cb(min(uploaded_bytes, total_bytes), total_bytes)
+
+    strategy = (config.DRIVE_SHARING_STRATEGY or "inherit").strip().lower()
+    if strategy not in DRIVE_SHARING_STRATEGIES:
+        strategy = "inherit"
+
+    def _checkpoint_key(file_path: str, file_name: str) -> str:
         try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            size = -1
+        return f"{file_path}|{file_name}|{size}"
+
+    def _upload_one(file_path: str, file_name: str) -> dict:
+        # 每个工作线程用自己的线程本地 service（httplib2 连接不能跨线程共享）
+        svc = get_drive_service()
+        key = _checkpoint_key(file_path, file_name)
+        with progress_lock:
+            item = done_files.get(key)
+        if item is None:
             metadata = {"name": file_name, "parents": [title_id]}
-            media = MediaFileUpload(file_path, resumable=True)
-            if progress_cb:
-                progress_cb(f'正在上傳“{file_name}”....', 0)
-            created = _execute_with_retry(
-                lambda: service.files().create(
-                    body=metadata,
-                    media_body=media,
-                    fields="id,webViewLink",
-                ).execute()
+            _progress(f'正在上傳“{file_name}”....', 0)
+
+            def _on_session(uri, progress):
+                with progress_lock:
+                    if uri:
+                        partial[key] = {"uri": uri, "progress": progress}
+                    else:
+                        partial.pop(key, None)
+
+            with progress_lock:
+                resume = partial.get(key)
+            created = _upload_file(
+                svc, file_path, metadata, _progress_bytes, resume=resume, on_session=_on_session
             )
             file_id = created.get("id")
             if not file_id:
-                return False, f"上傳失敗：未返回 fileId ({file_name})", None
-            if progress_cb:
-                progress_cb(f'上傳完成，設定檔案權限“{file_name}”', 1)
-            # 设为任何人可读（双保险）
-            _execute_with_retry(
-                lambda: service.permissions().create(
-                    fileId=file_id,
-                    body={"type": "anyone", "role": "reader"},
-                ).execute()
-            )
-            if progress_cb:
-                progress_cb(f'檔案權限已設定“{file_name}”', 1)
+                raise RuntimeError(f"上傳失敗：未返回 fileId ({file_name})")
             link = created.get("webViewLink") or f"https://drive.google.com/file/d/{file_id}/view"
-            items.append({"name": file_name, "id": file_id, "link": link})
+            item = {"name": file_name, "id": file_id, "link": link, "shared": False}
+            with progress_lock:
+                done_files[key] = item
+                partial.pop(key, None)
+            upload_status = "上傳完成"
+        else:
+            # 上次已传完：直接复用，进度照常推进
+            _progress_bytes(os.path.getsize(file_path))
+            upload_status = "已上傳（續傳略過）"
+        if strategy == "per_file":
+            _progress(f'{upload_status}，設定檔案權限“{file_name}”', 0 if byte_progress_cb else 1)
+            if not item.get("shared"):
+                _share_anyone_reader(svc, item["id"])
+                item["shared"] = True
+            _progress(f'檔案權限已設定“{file_name}”', 1)
+        else:
+            _progress(f'{upload_status}“{file_name}”', 0 if byte_progress_cb else 1)
+        return {"name": item["name"], "id": item["id"], "link": item["link"]}
+
+    pool = _get_upload_pool()
+    futures = [pool.submit(_upload_one, fp, fn) for fp, fn in zip(file_paths, file_names)]
+    # 任一文件失败即停止：未开始的任务取消，已在上传的等它结束
+    done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+    failed = next((f for f in futures if f in done and f.exception() is not None), None)
+    if failed is not None:
+        for f in futures:
+            f.cancel()
+        wait(futures)
+        return False, _format_gapi_error(failed.exception()), None
+    # 按提交顺序收集，保持与 file_names 一致
+    items = [f.result() for f in futures]
+
+    if strategy != "per_file" and items:
+        _progress("設定檔案權限", 0)
+        try:
+            _share_uploaded_files(service, [it["id"] for it in items], strategy)
         except Exception as e:
             return False, _format_gapi_error(e), None
+        _progress("檔案權限已設定", len(items))
     folder_link = f"https://drive.google.com/drive/folders/{title_id}"
     return True, None, {"items": items, "folder_link": folder_link, "folder_id": title_id, "title": title}
@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import config
+from core.time_utils import now_hk
+
+# Drive 文件夹 id 缓存：(父文件夹 id, 名称) -> (文件夹 id, 过期时间)。
+# 只缓存根/年/日这类长期存在的目录，落盘保存，重启后仍然有效。
+_cache_lock = threading.Lock()
+_cache: Optional[Dict[str, Tuple[str, float]]] = None
+# folder_id -> 最近一次确认未进回收站的日期（YYYY-MM-DD，HKT）。
+# 缓存的 id 不可全信（文件夹可能被移进回收站，API 不会返回 404），每个进程每天复查一次
+_verified_on: Dict[str, str] = {}
+
+
+def _cache_key(parent_id: str, name: str) -> str:
+    return f"{parent_id}/{name}"
+
+
+def _load_locked() -> Dict[str, Tuple[str, float]]:
+    global _cache
+    if _cache is not None:
+        return _cache
+    _cache = {}
+    try:
+        with open(config.DRIVE_FOLDER_CACHE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        now = time.time()
+        for key, (folder_id, expires_ts) in (data or {}).items():
+            if folder_id and float(expires_ts) > now:
+                _cache[key] = (str(folder_id), float(expires_ts))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"读取 Drive 文件夹缓存失败: {e}")
+    return _cache
+
+
+def _save_locked() -> None:
+    path = config.DRIVE_FOLDER_CACHE_PATH
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(_cache or {}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"写入 Drive 文件夹缓存失败: {e}")
+
+
+def get_cached_folder_id(parent_id: str, name: str) -> Optional[str]:
+    with _cache_lock:
+        entry = _load_locked().get(_cache_key(parent_id, name))
+    if not entry or entry[1] <= time.time():
+        return None
+    return entry[0]
+
+
+def put_cached_folder_id(parent_id: str, name: str, folder_id: str) -> None:
+    """写入刚查到/建好的文件夹 id（查询带 trashed=false，视为当天已确认）。"""
+    if not folder_id:
+        return
+    expires_ts = time.time() + config.DRIVE_FOLDER_CACHE_TTL_SECONDS
+    with _cache_lock:
+        _load_locked()[_cache_key(parent_id, name)] = (folder_id, expires_ts)
+        _verified_on[folder_id] = now_hk().strftime("%Y-%m-%d")
+        _save_locked()
+
+
+def folder_needs_verification(folder_id: str) -> bool:
+    with _cache_lock:
+        return _verified_on.get(folder_id) != now_hk().strftime("%Y-%m-%d")
+
+
+def mark_folder_verified(folder_id: str) -> None:
+    with _cache_lock:
+        _verified_on[folder_id] = now_hk().strftime("%Y-%m-%d")
+
+
+def has_cached_folders() -> bool:
+    with _cache_lock:
+        return bool(_load_locked())
+
+
+def invalidate_folder_ids(folder_ids) -> None:
+    """文件夹被删/移走（404）或进了回收站时调用：连同以它为父目录的条目一起清掉。"""
+    stale = {f for f in (folder_ids or []) if f}
+    if not stale:
+        return
+    with _cache_lock:
+        cache = _load_locked()
+        changed = True
+        while changed:
+            changed = False
+            for key, (folder_id, _) in list(cache.items()):
+                parent_id = key.split("/", 1)[0]
+                if folder_id in stale or parent_id in stale:
+                    del cache[key]
+                    stale.add(folder_id)
+                    changed = True
+        for folder_id in stale:
+            _verified_on.pop(folder_id, None)
+        _save_locked()
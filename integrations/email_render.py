@@ -0,0 +1,112 @@
+import hashlib
+import html
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import markdown
+
+# 公关稿正文渲染：复用同一个 Markdown 实例（每次 reset），正则预编译，
+# 渲染结果按正文内容的哈希缓存，重发/预览同一份正文时不再重复渲染。
+MARKDOWN_EXTENSIONS = ["extra", "sane_lists", "nl2br"]
+RENDER_CACHE_SIZE = 64
+
+_BLOCK_TAG_RE = re.compile(r"</?(p|div|li|ul|ol|h[1-6]|blockquote|br)\b", re.I)
+# PR 文案里常用 *xxx* 表示"加粗重点"；负向前后查找避免匹配 **xxx**
+_STAR_BOLD_RE = re.compile(r"(?<!\*)\*([^*\n]+?)\*(?!\*)")
+
+# Markdown 实例不是线程安全的：串行使用，每次转换前 reset
+_md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+_md_lock = threading.Lock()
+
+_render_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_key(pr_body_text: str, pr_body_html: Optional[str]) -> str:
+    h = hashlib.sha256()
+    h.update((pr_body_text or "").encode("utf-8"))
+    h.update(b"\0")
+    h.update((pr_body_html or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+def _render_uncached(pr_body_text: str, pr_body_html: Optional[str]) -> str:
+    if (pr_body_html or "").strip():
+        rich = (pr_body_html or "").strip()
+        # Telegram entities 转出的 HTML 常含换行符但不含块级标签；
+        # 这里显式换成 <br>，避免在邮件客户端被折叠成单段。
+        if not _BLOCK_TAG_RE.search(rich):
+            rich = rich.replace("\r\n", "\n").replace("\r", "\n").replace("\n", "<br>\n")
+        # Telegram HTML 里也可能有未转换的 *xxx*，转成 <b>xxx</b>
+        return _STAR_BOLD_RE.sub(r"<b>\1</b>", rich)
+    raw = (pr_body_text or "").strip()
+    if not raw or raw == "無":
+        return "<p>無</p>"
+    # *xxx* 统一转成 Markdown 粗体
+    raw = _STAR_BOLD_RE.sub(r"**\1**", raw)
+    # Escape raw HTML from user input but preserve Markdown syntax.
+    safe_markdown = html.escape(raw, quote=False)
+    with _md_lock:
+        try:
+            return _md.convert(safe_markdown)
+        finally:
+            _md.reset()
+
+
+def render_pr_body_html(pr_body_text: str, pr_body_html: Optional[str] = None) -> str:
+    key = _cache_key(pr_body_text, pr_body_html)
+    with _cache_lock:
+        cached = _render_cache.get(key)
+        if cached is not None:
+            _render_cache.move_to_end(key)
+            return cached
+
+    rendered = _render_uncached(pr_body_text, pr_body_html)
+    with _cache_lock:
+        _render_cache[key] = rendered
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return rendered
+
+
+def clear_render_cache() -> None:
+    with _cache_lock:
+        _render_cache.clear()
+
+
+def build_email_html(
+    *,
+    sender_info: dict,
+    settings: dict,
+    pr_body_text: str,
+    pr_body_html: Optional[str] = None,
+    attachments_text: Optional[str] = None,
+    rendered_pr_body_html: Optional[str] = None,
+) -> str:
+    meta_html = (
+        f"<p><strong>来自:</strong> {html.escape(sender_info.get('name', ''))} "
+        f"(@{html.escape(sender_info.get('username', ''))})</p>"
+        f"<p><strong>群组:</strong> {html.escape(sender_info.get('chat_title', ''))}</p>"
+        f"<p><strong>时间:</strong> {html.escape(sender_info.get('date', ''))}</p>"
+        f"<p><strong>類型：</strong>{html.escape(settings.get('type', ''))}</p>"
+        f"<p><strong>優先度：</strong>{html.escape(settings.get('priority', ''))}</p>"
+        f"<p><strong>語言：</strong>{html.escape(settings.get('language', ''))}</p>"
+        f"<p><strong>target:</strong> 來稿</p>"
+    )
+    if attachments_text is not None:
+        meta_html += f"<p><strong>附件:</strong> {html.escape(attachments_text)}</p>"
+
+    if rendered_pr_body_html is None:
+        rendered_pr_body_html = render_pr_body_html(pr_body_text, pr_body_html)
+    return (
+        '<div style="font-family: Arial, sans-serif; font-size: 14px; color: #111;">'
+        f"{meta_html}"
+        "<hr style='border:none;border-top:1px solid #ddd;margin:12px 0;'>"
+        "<p><strong>公關稿正文：</strong></p>"
+        "<div style='line-height:1.7;font-size:14px;'>"
+        f"{rendered_pr_body_html}"
+        "</div>"
+        "</div>"
+    )
@@ -1,27 +1,50 @@
 import base64
+import hashlib
 import html
 import json
 import os
-import pickle
 import re
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
 
 from email.header import Header
-from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from base64 import urlsafe_b64encode
 
-import markdown
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 import config
 from core.time_utils import now_hk
+from integrations.email_render import build_email_html, render_pr_body_html
+from integrations.gmail_quota import (
+    _is_rate_limit_error,
+    _retry_after_seconds,
+    acquire_quota,
+    gmail_execute,
+    note_rate_limited,
+    quota_cost,
+)
+from integrations.google_api import _is_retryable_gapi_error, get_service
+# 兼容旧调用方：凭证逻辑已移到 integrations.google_auth
+from integrations.google_auth import get_google_creds  # noqa: F401
+from integrations.logs_model import get_log_record, get_logs_snapshot
+from integrations.logs_store import get_log, get_logs_meta, upsert_logs
+from integrations.mime_stream import build_mime_stream, send_mime_stream
+
+# Gmail batch 接口单次最多 100 个子请求
+GMAIL_BATCH_MAX_SIZE = 100
+
+# Logs 列表只取需要的字段（partial response）
+LOG_METADATA_FIELDS = "id,internalDate,snippet,payload/headers"
+
+# 增量同步时忽略的系统标签
+LOG_SYNC_SKIP_LABELS = ("DRAFT", "SPAM", "TRASH")
+
+
 def _sanitize_drive_folder_name(name: str, max_len: int = 80) -> str:
     safe = (name or "").replace("/", "_").replace("\\", "_").strip()
     if not safe:
@@ -87,91 +110,71 @@ def _pick_subject_title(file_names: List[str], pr_body_text: str) -> str:
     return attachment_title
 
 
-def _render_pr_body_markdown_html(pr_body_text: str, pr_body_html: Optional[str] = None) -> str:
-    if (pr_body_html or "").strip():
-        rich = (pr_body_html or "").strip()
-        # Telegram entities 转出的 HTML 常含换行符但不含块级标签；
-        # 这里显式换成 <br>，避免在邮件客户端被折叠成单段。
-        if not re.search(r"</?(p|div|li|ul|ol|h[1-6]|blockquote|br)\b", rich, flags=re.I):
-            rich = rich.replace("\r\n", "\n").replace("\r", "\n").replace("\n", "<br>\n")
-        # PR 文案里常用 *xxx* 表示"加粗重点"，即使 Telegram HTML 也可能有未转换的 *xxx*，需要转换为 <b>xxx</b>
-        # 使用负向前后查找确保不会匹配已经是 **xxx** 的情况（避免匹配 <b>xxx</b> 因为 HTML 中不应该有 * 在标签内）
-        rich = re.sub(r"(?<!\*)\*([^*\n]+?)\*(?!\*)", r"<b>\1</b>", rich)
-        return rich
-    raw = (pr_body_text or "").strip()
-    if not raw or raw == "無":
-        return "<p>無</p>"
-    # PR 文案里常用 *xxx* 表示“加粗重点”，这里统一转成 Markdown 粗体。
-    raw = re.sub(r"(?<!\*)\*([^*\n]+?)\*(?!\*)", r"**\1**", raw)
-    # Escape raw HTML from user input but preserve Markdown syntax.
-    safe_markdown = html.escape(raw, quote=False)
-    return markdown.markdown(
-        safe_markdown,
-        extensions=["extra", "sane_lists", "nl2br"],
-    )
+def get_gmail_service():
+    # 线程本地 service：请在实际调用 API 的工作线程里获取
+    return get_service("gmail", "v1")
 
 
-def _build_email_html(
+def _send_streamed_email(
+    service,
     *,
-    sender_info: dict,
-    settings: dict,
-    pr_body_text: str,
-    pr_body_html: Optional[str] = None,
-    attachments_text: Optional[str] = None,
-) -> str:
-    meta_html = (
-        f"<p><strong>来自:</strong> {html.escape(sender_info.get('name', ''))} "
-        f"(@{html.escape(sender_info.get('username', ''))})</p>"
-        f"<p><strong>群组:</strong> {html.escape(sender_info.get('chat_title', ''))}</p>"
-        f"<p><strong>时间:</strong> {html.escape(sender_info.get('date', ''))}</p>"
-        f"<p><strong>類型：</strong>{html.escape(settings.get('type', ''))}</p>"
-        f"<p><strong>優先度：</strong>{html.escape(settings.get('priority', ''))}</p>"
-        f"<p><strong>語言：</strong>{html.escape(settings.get('language', ''))}</p>"
-        f"<p><strong>target:</strong> 來稿</p>"
-    )
-    if attachments_text is not None:
-        meta_html += f"<p><strong>附件:</strong> {html.escape(attachments_text)}</p>"
-
-    rendered_pr_body_html = _render_pr_body_markdown_html(pr_body_text, pr_body_html)
-    return (
-        '<div style="font-family: Arial, sans-serif; font-size: 14px; color: #111;">'
-        f"{meta_html}"
-        "<hr style='border:none;border-top:1px solid #ddd;margin:12px 0;'>"
-        "<p><strong>公關稿正文：</strong></p>"
-        "<div style='line-height:1.7;font-size:14px;'>"
-        f"{rendered_pr_body_html}"
-        "</div>"
-        "</div>"
-    )
-
-
-def _attach_plain_and_html_body(message: MIMEMultipart, plain_body: str, html_body: str):
-    alt = MIMEMultipart("alternative")
-    alt.attach(MIMEText(plain_body, "plain", "utf-8"))
-    alt.attach(MIMEText(html_body, "html", "utf-8"))
-    message.attach(alt)
+    subject: str,
+    plain_body: str,
+    html_body: str,
+    attachments: list,
+    message_id: Optional[str] = None,
+):
+    stream = None
+    try:
+        stream, size = build_mime_stream(
+            to=config.TARGET_EMAIL,
+            subject=subject,
+            plain_body=plain_body,
+            html_body=html_body,
+            attachments=attachments,
+            message_id=message_id,
+        )
+        service = service or get_gmail_service()
+        send_mime_stream(service, stream, size)
+        return True, None
+    except Exception as e:
+        print(f"发送邮件失败: {e}")
+        return False, str(e)
+    finally:
+        if stream is not None:
+            stream.close()
 
 
-def get_google_creds():
-    creds = None
-    if os.path.exists("token.pickle"):
-        with open("token.pickle", "rb") as token:
-            creds = pickle.load(token)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                "credentials.json", config.SCOPES
-            )
-            creds = flow.run_local_server(port=0, access_type="offline", prompt="consent")
-        with open("token.pickle", "wb") as token:
-            pickle.dump(creds, token)
-    return creds
+def _attachment_email_fingerprint(
+    file_names, settings, pr_body_text: str = "", pr_body_html: Optional[str] = None
+) -> str:
+    payload = json.dumps(
+        [list(file_names), dict(settings or {}), pr_body_text or "", pr_body_html or ""],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
-def get_gmail_service():
-    return build("gmail", "v1", credentials=get_google_creds())
+def prerender_attachment_email(
+    file_names, settings, pr_body_text: str = "", pr_body_html: Optional[str] = None
+) -> dict:
+    """
+    预先算好附件邮件里与发件人/发送时间无关的部分：主题与公关稿正文 HTML。
+    结果带指纹，正文、设置或附件列表变化后即失效。
+    """
+    subject_title = _pick_subject_title(list(file_names), pr_body_text)
+    subject = "新稿件: " + subject_title
+    if len(subject) > config.MAX_SUBJECT_LEN:
+        subject = subject[: config.MAX_SUBJECT_LEN - 3] + "..."
+    pr_body_value = (pr_body_text or "").strip() or "無"
+    return {
+        "fingerprint": _attachment_email_fingerprint(
+            file_names, settings, pr_body_text, pr_body_html
+        ),
+        "subject": subject,
+        "pr_body_rendered": render_pr_body_html(pr_body_value, pr_body_html),
+    }
 
 
 def send_email_with_attachments(
@@ -182,14 +185,15 @@ def send_email_with_attachments(
     settings,
     pr_body_text: str = "",
     pr_body_html: Optional[str] = None,
+    *,
+    message_id: Optional[str] = None,
+    prerendered: Optional[dict] = None,
 ):
-    message = MIMEMultipart()
-    message["to"] = config.TARGET_EMAIL
-    subject_title = _pick_subject_title(list(file_names), pr_body_text)
-    subject = "新稿件: " + subject_title
-    if len(subject) > config.MAX_SUBJECT_LEN:
-        subject = subject[: config.MAX_SUBJECT_LEN - 3] + "..."
-    message["subject"] = subject
+    # 会话里预渲染的结果只在指纹一致（正文/设置/附件列表都没变）时使用
+    fingerprint = _attachment_email_fingerprint(file_names, settings, pr_body_text, pr_body_html)
+    if not prerendered or prerendered.get("fingerprint") != fingerprint:
+        prerendered = prerender_attachment_email(file_names, settings, pr_body_text, pr_body_html)
+    subject = prerendered["subject"]
 
     pr_body_value = (pr_body_text or "").strip() or "無"
     body = f"""
@@ -204,33 +208,44 @@ target: 來稿
 
 公關稿正文：{pr_body_value}
 """
-    html_body = _build_email_html(
+    html_body = build_email_html(
         sender_info=sender_info,
         settings=settings,
         pr_body_text=pr_body_value,
         pr_body_html=pr_body_html,
         attachments_text=", ".join(file_names),
+        rendered_pr_body_html=prerendered["pr_body_rendered"],
+    )
+    attachments = [
+        (file_path, Header(file_name, "utf-8").encode())
+        for file_path, file_name in zip(file_paths, file_names)
+    ]
+    return _send_streamed_email(
+        service,
+        subject=subject,
+        plain_body=body,
+        html_body=html_body,
+        attachments=attachments,
+        message_id=message_id,
     )
-    _attach_plain_and_html_body(message, body, html_body)
 
-    for file_path, file_name in zip(file_paths, file_names):
-        try:
-            with open(file_path, "rb") as f:
-                part = MIMEApplication(f.read())
-                part.add_header(
-                    "Content-Disposition", "attachment", filename=(Header(file_name, "utf-8").encode())
-                )
-                message.attach(part)
-        except Exception as e:
-            print(f"无法读取文件: {file_name}, {e}")
 
-    raw_message = urlsafe_b64encode(message.as_bytes()).decode()
-    try:
-        service.users().messages().send(userId="me", body={"raw": raw_message}).execute()
-        return True, None
-    except Exception as e:
-        print(f"发送邮件失败: {e}")
-        return False, str(e)
+def make_message_id(idempotency_key: str) -> str:
+    return f"<{idempotency_key}@bp-press-release-bot>"
+
+
+def was_message_sent(message_id: str, service=None) -> bool:
+    """按 Message-ID 查已发送邮件，用于重试前的幂等检查。"""
+    service = service or get_gmail_service()
+    resp = gmail_execute(
+        "messages.list",
+        lambda: service.users().messages().list(
+            userId="me",
+            q=f"in:sent rfc822msgid:{message_id.strip('<>')}",
+            maxResults=1,
+        ).execute(),
+    )
+    return bool(resp.get("messages"))
 
 
 def send_email_with_drive_links(
@@ -246,8 +261,6 @@ def send_email_with_drive_links(
     attachment_paths: List[str],
     attachment_names: List[str],
 ):
-    message = MIMEMultipart()
-    message["to"] = config.TARGET_EMAIL
     # 如果有长信息，优先使用公关稿标题；否则使用非图片附件的名字作为标题
     pr_body_title = _pick_title_from_pr_body(pr_body_text)
     if pr_body_title:
@@ -266,7 +279,6 @@ def send_email_with_drive_links(
     subject = "新稿件(Drive): " + subject_title
     if len(subject) > config.MAX_SUBJECT_LEN:
         subject = subject[: config.MAX_SUBJECT_LEN - 3] + "..."
-    message["subject"] = subject
 
     pr_body_value = (pr_body_text or "").strip() or "無"
     body = f"""
@@ -280,24 +292,16 @@ target: 來稿
 
 公關稿正文：{pr_body_value}
 """
-    html_body = _build_email_html(
+    html_body = build_email_html(
         sender_info=sender_info,
         settings=settings,
         pr_body_text=pr_body_value,
         pr_body_html=pr_body_html,
     )
-    _attach_plain_and_html_body(message, body, html_body)
-
-    for file_path, file_name in zip(attachment_paths, attachment_names):
-        try:
-            with open(file_path, "rb") as f:
-                part = MIMEApplication(f.read())
-                part.add_header(
-                    "Content-Disposition", "attachment", filename=(Header(file_name, "utf-8").encode())
-                )
-                message.attach(part)
-        except Exception as e:
-            print(f"无法读取文件: {file_name}, {e}")
+    attachments = [
+        (file_path, Header(file_name, "utf-8").encode())
+        for file_path, file_name in zip(attachment_paths, attachment_names)
+    ]
 
     drive_links_payload = {
         "title": subject_title,
@@ -310,22 +314,14 @@ target: 來稿
     drive_links_bytes = json.dumps(
         drive_links_payload, ensure_ascii=False, indent=2
     ).encode("utf-8")
-    drive_links_part = MIMEApplication(drive_links_bytes)
     # 如果同时触发大批量模式和长信息模式，使用不同的JSON文件名
     has_long_msg = pr_body_value != "無"
     json_filename = "long_msg_drive_links.json" if has_long_msg else "drive_links.json"
-    drive_links_part.add_header(
-        "Content-Disposition", "attachment", filename=(json_filename)
-    )
-    message.attach(drive_links_part)
+    attachments.append((drive_links_bytes, json_filename))
 
-    raw_message = urlsafe_b64encode(message.as_bytes()).decode()
-    try:
-        service.users().messages().send(userId="me", body={"raw": raw_message}).execute()
-        return True, None
-    except Exception as e:
-        print(f"发送邮件失败: {e}")
-        return False, str(e)
+    return _send_streamed_email(
+        service, subject=subject, plain_body=body, html_body=html_body, attachments=attachments
+    )
 
 
 def send_email_with_fb_url(service, fb_url: str, sender_info: dict, settings: dict):
@@ -346,71 +342,48 @@ target: 來稿
     message.attach(MIMEText(body, "plain", "utf-8"))
     raw_message = urlsafe_b64encode(message.as_bytes()).decode()
     try:
-        service.users().messages().send(
-            userId="me",
-            body={"raw": raw_message},
-        ).execute()
+        service = service or get_gmail_service()
+        gmail_execute(
+            "messages.send",
+            lambda: service.users().messages().send(
+                userId="me",
+                body={"raw": raw_message},
+            ).execute(),
+            idempotent=False,
+        )
         return True, None
     except Exception as e:
         print(f"发送 FB URL 邮件失败: {e}")
         return False, str(e)
 
 
-def ensure_logs_cache():
-    if os.path.exists(config.LOGS_CACHE_PATH):
-        return
-    with open(config.LOGS_CACHE_PATH, "w", encoding="utf-8") as f:
-        json.dump([], f, ensure_ascii=False, indent=2)
-
-
 def get_logs_cache_info() -> dict:
-    ensure_logs_cache()
-    try:
-        mtime = os.path.getmtime(config.LOGS_CACHE_PATH)
-        dt = datetime.fromtimestamp(mtime, now_hk().tzinfo)
-        age_seconds = max(0, int((now_hk() - dt).total_seconds()))
-        return {
-            "last_refresh_ts": dt.isoformat(timespec="seconds"),
-            "age_seconds": age_seconds,
-            "ttl_seconds": config.LOGS_CACHE_TTL_SECONDS,
-            "stale": age_seconds > config.LOGS_CACHE_TTL_SECONDS,
-        }
-    except Exception:
+    # meta 随内存模型一起缓存，version 不变时不再查库
+    _, _, meta = get_logs_snapshot()
+    last_refresh = meta.get("last_refresh")
+    if not last_refresh:
         return {
             "last_refresh_ts": None,
             "age_seconds": None,
             "ttl_seconds": config.LOGS_CACHE_TTL_SECONDS,
             "stale": True,
         }
+    dt = datetime.fromtimestamp(last_refresh, now_hk().tzinfo)
+    age_seconds = max(0, int((now_hk() - dt).total_seconds()))
+    return {
+        "last_refresh_ts": dt.isoformat(timespec="seconds"),
+        "age_seconds": age_seconds,
+        "ttl_seconds": config.LOGS_CACHE_TTL_SECONDS,
+        "stale": age_seconds > config.LOGS_CACHE_TTL_SECONDS,
+    }
 
 
-def read_logs_cache() -> List[dict]:
-    ensure_logs_cache()
-    try:
-        with open(config.LOGS_CACHE_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data if isinstance(data, list) else []
-    except Exception:
-        return []
-
-
-def upsert_logs_cache(items: list):
-    ensure_logs_cache()
-    existing = read_logs_cache()
-    by_key = {}
-    for x in existing:
-        k = x.get("gmail_id") or x.get("id")
-        if k:
-            by_key[k] = x
-    for it in items:
-        k = it.get("gmail_id") or it.get("id")
-        if k:
-            by_key[k] = it
-
-    merged = list(by_key.values())
-    merged.sort(key=lambda r: r.get("ts", ""), reverse=True)
-    with open(config.LOGS_CACHE_PATH, "w", encoding="utf-8") as f:
-        json.dump(merged, f, ensure_ascii=False, indent=2)
+def get_logs_sync_state() -> dict:
+    meta = get_logs_meta()
+    return {
+        "history_id": meta.get("history_id"),
+        "synced_days": meta.get("synced_days") or 0,
+    }
 
 
 def _safe_header(headers: list, name: str) -> str:
@@ -435,21 +408,64 @@ def _parse_status_error_from_subject(subject: str):
     return "UNKNOWN", None
 
 
+# log 邮件正文里的已知字段名。snippet 会把换行压成空格，
+# 所以字段值只取到下一个已知字段名（或换行）为止
+LOG_FIELD_LABELS = (
+    "Gmail ID",
+    "Original Subject",
+    "Error Code",
+    "Error",
+    "Processed at",
+    "Post ID",
+    "WP Title",
+    "Original URL",
+    "Target",
+    "Status",
+)
+_LOG_FIELD_STOP = r"(?=\s+(?:%s)\s*:|[\r\n]|$)" % "|".join(re.escape(x) for x in LOG_FIELD_LABELS)
+_GMAIL_ID_RE = re.compile(r"Gmail ID\s*:\s*([0-9a-fA-F]+)")
+_ORIGINAL_SUBJECT_RE = re.compile(r"Original Subject\s*:\s*(.*?)" + _LOG_FIELD_STOP)
+# Gmail 消息 id 是 16 位十六进制
+_FULL_GMAIL_ID_RE = re.compile(r"[0-9a-fA-F]{16}")
+_SNIPPET_ELLIPSIS = ("...", "…")
+
+
 def _extract_fields_from_text(text: str):
     gmail_id = None
     original_subject = None
 
-    m1 = re.search(r"Gmail ID\s*:\s*([0-9a-fA-F]+)", text or "")
+    m1 = _GMAIL_ID_RE.search(text or "")
     if m1:
         gmail_id = m1.group(1).strip()
 
-    m2 = re.search(r"Original Subject\s*:\s*([^\r\n]+)", text or "")
+    m2 = _ORIGINAL_SUBJECT_RE.search(text or "")
     if m2:
-        original_subject = m2.group(1).strip()
+        original_subject = m2.group(1).strip() or None
 
     return gmail_id, original_subject
 
 
+def _extract_fields_from_snippet(snippet: str):
+    """
+    从 snippet 解析 Gmail ID / Original Subject，返回 (gmail_id, original_subject, complete)。
+    snippet 约 200 字截断：只有没有省略号、id 是完整 16 位、标题后面还跟着别的字段时
+    才算完整；否则结果只作临时展示（complete=False），仍需按需拉正文。
+    """
+    text = (snippet or "").strip()
+    gmail_id, original_subject = _extract_fields_from_text(text)
+    complete = bool(
+        gmail_id
+        and original_subject
+        and not text.endswith(_SNIPPET_ELLIPSIS)
+        and _FULL_GMAIL_ID_RE.fullmatch(gmail_id)
+    )
+    if complete:
+        # 标题一直延伸到 snippet 末尾时可能被截断
+        m = _ORIGINAL_SUBJECT_RE.search(text)
+        complete = bool(m) and m.end() < len(text)
+    return gmail_id, original_subject, complete
+
+
 def _b64url_decode(data: str) -> str:
     if not data:
         return ""
@@ -482,18 +498,175 @@ def _extract_text_from_payload(payload: dict) -> str:
     return ""
 
 
-def fetch_logs_from_gmail(days: int = 1, max_results: int = 200) -> int:
+def _batch_get_messages(
+    service,
+    message_ids: List[str],
+    *,
+    max_attempts: int = 3,
+    base_sleep: float = 1.0,
+    **get_kwargs,
+) -> Dict[str, dict]:
+    """
+    用 Gmail batch 请求批量 messages().get，每个 HTTP 请求最多 GMAIL_BATCH_MAX_SIZE 个子请求。
+    - 返回 {message_id: detail}，失败的条目不会出现在结果里
+    - 限流（429/403 rateLimitExceeded）与 5xx 的子请求会退避后重试；其他错误只打印，不影响其他条目
+    """
+    results: Dict[str, dict] = {}
+    pending = [mid for mid in dict.fromkeys(message_ids or []) if mid]
+
+    for attempt in range(1, max_attempts + 1):
+        if not pending:
+            break
+        retry_ids: List[str] = []
+
+        def _on_item(request_id, response, exception):
+            if exception is None:
+                results[request_id] = response
+            elif _is_rate_limit_error(exception):
+                # 429 或 403 userRateLimitExceeded：全局暂停后重试该条目
+                note_rate_limited(_retry_after_seconds(exception) or base_sleep)
+                retry_ids.append(request_id)
+            elif _is_retryable_gapi_error(exception):
+                retry_ids.append(request_id)
+            else:
+                print(f"批量获取邮件失败: {request_id}, {exception}")
+
+        for start in range(0, len(pending), GMAIL_BATCH_MAX_SIZE):
+            chunk = pending[start : start + GMAIL_BATCH_MAX_SIZE]
+            batch = service.new_batch_http_request(callback=_on_item)
+            for mid in chunk:
+                batch.add(
+                    service.users().messages().get(userId="me", id=mid, **get_kwargs),
+                    request_id=mid,
+                )
+            # batch 里每个子请求单独计配额
+            acquire_quota(quota_cost("messages.get", len(chunk)))
+            try:
+                batch.execute()
+            except Exception as e:
+                # 整个 batch 请求失败：未拿到结果的条目按可重试处理
+                if _is_rate_limit_error(e):
+                    note_rate_limited(_retry_after_seconds(e) or base_sleep)
+                elif not _is_retryable_gapi_error(e):
+                    raise
+                retry_ids.extend(mid for mid in chunk if mid not in results and mid not in retry_ids)
+
+        pending = retry_ids
+        if pending and attempt < max_attempts:
+            time.sleep(base_sleep * (2 ** (attempt - 1)))
+
+    if pending:
+        print(f"批量获取邮件重试后仍失败: {len(pending)} 封")
+    return results
+
+
+def _build_log_record(detail: Optional[dict]) -> Optional[dict]:
+    """从 metadata 格式的邮件构造一条 logs 记录；非 SUCCESS/ERROR 邮件返回 None。"""
+    if not detail or not detail.get("id"):
+        return None
+    payload = detail.get("payload") or {}
+    subject = _safe_header(payload.get("headers") or [], "Subject")
+
+    status, error_code = _parse_status_error_from_subject(subject)
+    if status not in ("SUCCESS", "ERROR"):
+        return None
+
+    # Gmail 的 snippet 是 HTML 转义过的纯文本
+    snippet = html.unescape(detail.get("snippet") or "")
+    gmail_id, original_subject, complete = _extract_fields_from_snippet(snippet)
+    if not complete:
+        # 可能被截断的 id 不能写进记录：它会成为 store 的去重键（dedup_key）；
+        # gmail_id 为空也保证 log_record_needs_body() 为 True，打开详情时拉正文纠正
+        gmail_id = None
+
+    internal_ms = int(detail.get("internalDate", "0") or "0")
+    ts = datetime.fromtimestamp(internal_ms / 1000, now_hk().tzinfo).isoformat(
+        timespec="seconds"
+    )
+
+    title = original_subject or subject
+    return {
+        "id": detail.get("id"),
+        "ts": ts,
+        "status": status,
+        "error_code": error_code,
+        "title": title,
+        "short_title": (title or "")[:8],
+        "subject": subject,
+        "gmail_id": gmail_id,
+        "original_subject": original_subject,
+        "body_fetched": False,
+    }
+
+
+def log_record_needs_body(record: dict) -> bool:
+    """snippet 没能可靠解析出 Gmail ID / Original Subject（缺失或可能被截断），且还没拉过正文。"""
+    if not record or record.get("body_fetched"):
+        return False
+    return not (record.get("gmail_id") and record.get("original_subject"))
+
+
+def hydrate_log_record(log_id: str) -> Optional[dict]:
+    """
+    按需拉取单封 log 邮件的正文，补全 Gmail ID / Original Subject 并写回缓存。
+    返回补全后的记录；缓存里没有该记录时返回 None。
+    """
+    record = get_log(log_id)
+    if not record or not log_record_needs_body(record):
+        return record
+
     service = get_gmail_service()
+    detail = gmail_execute(
+        "messages.get",
+        lambda: service.users().messages().get(
+            userId="me",
+            id=record.get("id"),
+            format="full",
+            fields="id,payload",
+        ).execute(),
+    )
+    body_text = _extract_text_from_payload(detail.get("payload") or {}) or ""
+    gmail_id, original_subject = _extract_fields_from_text(body_text)
+
+    record = dict(record)
+    record["gmail_id"] = gmail_id or record.get("gmail_id")
+    record["original_subject"] = original_subject or record.get("original_subject")
+    title = record.get("original_subject") or record.get("subject")
+    record["title"] = title
+    record["short_title"] = (title or "")[:8]
+    record["body_fetched"] = True
+    upsert_logs([record])
+    return record
+
+
+def _hydrate_log_records(service, msg_ids: List[str]) -> List[dict]:
+    # 列表只需要 Subject / internalDate / snippet：用 metadata + fields 部分响应，
+    # 正文留到打开详情时再按需拉取（见 hydrate_log_record）
+    details = _batch_get_messages(
+        service,
+        msg_ids,
+        format="metadata",
+        metadataHeaders=["Subject"],
+        fields=LOG_METADATA_FIELDS,
+    )
+    out = []
+    for mid in msg_ids:
+        record = _build_log_record(details.get(mid))
+        if record:
+            out.append(record)
+    return out
+
+
+def _sync_logs_full(service, days: int, max_results: int) -> int:
+    # 先记下当前 historyId，list 期间新到的邮件留给下一次增量同步
+    profile = gmail_execute(
+        "getProfile", lambda: service.users().getProfile(userId="me").execute()
+    )
+    history_id = profile.get("historyId")
 
     # 只抓 Subject 含 SUCCESS/ERROR 的邮件，避免 (SUCCESS OR ERROR) 误命中正文
     q = f"(subject:SUCCESS OR subject:ERROR) newer_than:{days}d"
 
-    # 初步测试输出
-    print("q =", q)
-    resp = service.users().messages().list(userId="me", q=q, maxResults=100).execute()
-    print("resultSizeEstimate =", resp.get("resultSizeEstimate"))
-    print("messages len =", len(resp.get("messages", []) or []))
-
     # 1) 先分页 list 拿到 message id 列表
     msgs = []
     page_token = None
@@ -502,13 +675,16 @@ def fetch_logs_from_gmail(days: int = 1, max_results: int = 200) -> int:
         if remaining <= 0:
             break
 
-        resp = service.users().messages().list(
-            userId="me",
-            q=q,
-            maxResults=min(100, remaining),
-            pageToken=page_token,
-            # ⚠️ 不要写 labelIds=["INBOX"]，否则归档/不在收件箱的 logs 会抓不到
-        ).execute()
+        resp = gmail_execute(
+            "messages.list",
+            lambda: service.users().messages().list(
+                userId="me",
+                q=q,
+                maxResults=min(100, remaining),
+                pageToken=page_token,
+                # ⚠️ 不要写 labelIds=["INBOX"]，否则归档/不在收件箱的 logs 会抓不到
+            ).execute(),
+        )
 
         batch = resp.get("messages", []) or []
         msgs.extend(batch)
@@ -517,305 +693,150 @@ def fetch_logs_from_gmail(days: int = 1, max_results: int = 200) -> int:
         if not page_token:
             break
 
-    # 2) 对每封邮件 get(full) 解析字段
-    out = []
-    for m in msgs:
-        mid = m.get("id")
-        if not mid:
-            continue
-
-        detail = service.users().messages().get(
-            userId="me",
-            id=mid,
-            format="full",
-        ).execute()
-
-        payload = detail.get("payload") or {}
-        headers = payload.get("headers") or []
-        subject = _safe_header(headers, "Subject")
-
-        status, error_code = _parse_status_error_from_subject(subject)
-        if status not in ("SUCCESS", "ERROR"):
-            continue
+    # 2) 批量拉 metadata 解析字段
+    msg_ids = [m.get("id") for m in msgs if m.get("id")]
+    out = _hydrate_log_records(service, msg_ids)
 
-        snippet = detail.get("snippet") or ""
-        body_text = _extract_text_from_payload(payload) or ""
+    upsert_logs(out, sync_state={"history_id": history_id, "synced_days": days})
+    return len(out)
 
-        gmail_id, original_subject = _extract_fields_from_text(body_text)
-        if not original_subject:
-            gmail_id2, original_subject2 = _extract_fields_from_text(snippet)
-            gmail_id = gmail_id or gmail_id2
-            original_subject = original_subject2
 
-        internal_ms = int(detail.get("internalDate", "0") or "0")
-        ts = datetime.fromtimestamp(internal_ms / 1000, now_hk().tzinfo).isoformat(
-            timespec="seconds"
+def _sync_logs_incremental(service, history_id: str, synced_days: int) -> int:
+    msg_ids = []
+    latest_history_id = history_id
+    page_token = None
+    while True:
+        resp = gmail_execute(
+            "history.list",
+            lambda: service.users().history().list(
+                userId="me",
+                startHistoryId=history_id,
+                historyTypes=["messageAdded"],
+                pageToken=page_token,
+            ).execute(),
         )
+        for h in resp.get("history") or []:
+            for added in h.get("messagesAdded") or []:
+                m = added.get("message") or {}
+                label_ids = m.get("labelIds") or []
+                # 与 search 默认行为保持一致：不看草稿/垃圾邮件/回收站
+                if any(x in label_ids for x in LOG_SYNC_SKIP_LABELS):
+                    continue
+                if m.get("id"):
+                    msg_ids.append(m.get("id"))
+        latest_history_id = resp.get("historyId") or latest_history_id
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            break
 
-        title = original_subject or subject
-        short_title = (title or "")[:8]
-
-        out.append(
-            {
-                "id": mid,
-                "ts": ts,
-                "status": status,
-                "error_code": error_code,
-                "title": title,
-                "short_title": short_title,
-                "subject": subject,
-                "gmail_id": gmail_id,
-                "original_subject": original_subject,
-            }
-        )
+    msg_ids = list(dict.fromkeys(msg_ids))
+    out = _hydrate_log_records(service, msg_ids) if msg_ids else []
 
-    upsert_logs_cache(out)
+    # 即使没有新邮件也写回游标，同时刷新缓存时间
+    upsert_logs(
+        out, sync_state={"history_id": latest_history_id, "synced_days": synced_days}
+    )
     return len(out)
 
 
-def _extract_json_attachment(service, message_id: str, payload: dict) -> Optional[Dict[str, Any]]:
-    """从邮件payload中提取JSON附件并解析"""
-    if not payload:
-        return None
+def _quote_search_value(value: str) -> str:
+    return '"' + (value or "").replace('"', " ") + '"'
 
-    def _find_json_in_parts(parts: List[dict]) -> Optional[str]:
-        for part in parts:
-            mime = (part.get("mimeType") or "").lower()
-            filename = ""
-            for h in part.get("headers", []):
-                if (h.get("name") or "").lower() == "content-disposition":
-                    cd = h.get("value") or ""
-                    m = re.search(r'filename="?([^"]+)"?', cd, re.IGNORECASE)
-                    if m:
-                        filename = m.group(1)
-                    break
-
-            # 检查是否是JSON附件
-            if filename.lower().endswith(".json") or mime == "application/json":
-                att_id = part.get("body", {}).get("attachmentId")
-                if att_id:
-                    try:
-                        att_resp = service.users().messages().attachments().get(
-                            userId="me", messageId=message_id, id=att_id
-                        ).execute()
-                        att_data = att_resp.get("data", "")
-                        json_str = _b64url_decode(att_data)
-                        return json.loads(json_str)
-                    except Exception:
-                        pass
-
-            # 递归检查子parts
-            if part.get("parts"):
-                result = _find_json_in_parts(part.get("parts", []))
-                if result:
-                    return result
-        return None
 
-    # 检查顶层是否是multipart
-    mime = (payload.get("mimeType") or "").lower()
-    if mime.startswith("multipart/"):
-        parts = payload.get("parts", [])
-        return _find_json_in_parts(parts)
-    elif mime == "application/json":
-        # 直接是JSON
-        body = payload.get("body", {})
-        data = body.get("data")
-        if data:
-            json_str = _b64url_decode(data)
-            return json.loads(json_str)
-
-    return None
-
-
-def fetch_rthk_emails_for_excel(hours: int = 24, max_results: int = 500) -> List[Dict[str, Any]]:
+def search_logs_in_gmail(
+    keyword: str,
+    days: int,
+    page_token: Optional[str] = None,
+    page_size: int = 50,
+):
+    """
+    关键字在本地缓存里找不全时，用 Gmail 服务端搜索 subject 再拉一页写入 logs store。
+    返回 (新写入的记录数, 下一页 pageToken 或 None)。
+    """
     service = get_gmail_service()
-    subject_keyword = "RTHK Batch"
-    preferred_label_name = "公關稿ai-logs"
-    q = 'subject:"RTHK Batch" newer_than:1d'
-
-    def _norm_label_name(name: str) -> str:
-        # 统一：大小写不敏感 + 去空白 + 去连字符，兼容 "AI Logs" / "ai-logs" 等差异
-        return re.sub(r"[\s\-_]+", "", (name or "").strip().lower())
-
-    label_id = None
-    target_norm = _norm_label_name(preferred_label_name)
-    try:
-        labels_resp = service.users().labels().list(userId="me").execute()
-        labels = labels_resp.get("labels", []) or []
-
-        # 1) 优先精确名（忽略大小写）
-        for lb in labels:
-            lb_name = (lb.get("name") or "").strip()
-            if lb_name.lower() == preferred_label_name.lower():
-                label_id = lb.get("id")
-                break
-
-        # 2) 再做规范化模糊匹配（兼容空格/连字符）
-        if not label_id:
-            for lb in labels:
-                lb_name = lb.get("name") or ""
-                if _norm_label_name(lb_name) == target_norm:
-                    label_id = lb.get("id")
-                    break
-        # 3) 最后做"包含式"匹配，兼容名称有前后缀
-        if not label_id:
-            for lb in labels:
-                lb_name = lb.get("name") or ""
-                n = _norm_label_name(lb_name)
-                if target_norm in n or n in target_norm:
-                    label_id = lb.get("id")
-                    break
-    except Exception:
-        label_id = None
-
-    msgs = []
-    page_token = None
-    while True:
-        remaining = max_results - len(msgs)
-        if remaining <= 0:
-            break
-        # 先按 subject 拉候选，再在 get(full) 里按 labelId 严格过滤。
-        # 这样保留 label 条件，同时规避 list 接口对 label 查询的兼容问题。
-        resp = service.users().messages().list(
+    q = (
+        f"(subject:SUCCESS OR subject:ERROR) subject:{_quote_search_value(keyword)} "
+        f"newer_than:{days}d"
+    )
+    resp = gmail_execute(
+        "messages.list",
+        lambda: service.users().messages().list(
             userId="me",
             q=q,
-            maxResults=min(100, remaining),
+            maxResults=page_size,
             pageToken=page_token,
-        ).execute()
-        msgs.extend(resp.get("messages", []) or [])
-        page_token = resp.get("nextPageToken")
-        if not page_token:
-            break
-
-    cutoff = now_hk() - timedelta(hours=hours)
-    out: List[Dict[str, Any]] = []
-    for msg in msgs:
-        mid = msg.get("id")
-        if not mid:
-            continue
-        detail = service.users().messages().get(userId="me", id=mid, format="full").execute()
-        if label_id:
-            msg_label_ids = detail.get("labelIds", []) or []
-            if label_id not in msg_label_ids:
-                continue
-        payload = detail.get("payload") or {}
-        subject = _safe_header(payload.get("headers") or [], "Subject").strip()
-        if subject_keyword.lower() not in subject.lower():
-            continue
-
-        internal_ms = int(detail.get("internalDate", "0") or "0")
-        ts_dt = datetime.fromtimestamp(internal_ms / 1000, now_hk().tzinfo)
-        if ts_dt < cutoff:
-            continue
-
-        # 提取JSON附件
-        json_data = _extract_json_attachment(service, mid, payload)
-
-        out.append(
-            {
-                "id": mid,
-                "subject": subject,
-                "ts": ts_dt.isoformat(timespec="seconds"),
-                "json_data": json_data,
-            }
-        )
-
-    out.sort(key=lambda x: x.get("ts", ""))
-    return out
-
-
-def fetch_dotdot_emails_for_excel(hours: int = 24, max_results: int = 500) -> List[Dict[str, Any]]:
-    service = get_gmail_service()
-    subject_keyword = "DotDot News Batch Processed"
-    preferred_label_name = "公關稿ai-logs"
-    q = 'subject:"DotDot News Batch Processed" newer_than:1d'
+        ).execute(),
+    )
+    msg_ids = [m.get("id") for m in resp.get("messages") or [] if m.get("id")]
+    # 已在缓存里的不再重复拉取
+    msg_ids = [mid for mid in msg_ids if get_log_record(mid) is None]
+    out = _hydrate_log_records(service, msg_ids) if msg_ids else []
+    if out:
+        # 不带 sync_state：不影响增量同步游标和刷新时间
+        upsert_logs(out)
+    return len(out), resp.get("nextPageToken")
 
-    def _norm_label_name(name: str) -> str:
-        # 统一：大小写不敏感 + 去空白 + 去连字符，兼容 "AI Logs" / "ai-logs" 等差异
-        return re.sub(r"[\s\-_]+", "", (name or "").strip().lower())
 
-    label_id = None
-    target_norm = _norm_label_name(preferred_label_name)
-    try:
-        labels_resp = service.users().labels().list(userId="me").execute()
-        labels = labels_resp.get("labels", []) or []
-
-        # 1) 优先精确名（忽略大小写）
-        for lb in labels:
-            lb_name = (lb.get("name") or "").strip()
-            if lb_name.lower() == preferred_label_name.lower():
-                label_id = lb.get("id")
-                break
+# 同一时间只跑一次 logs 同步（single-flight）：
+# 窗口被正在进行的同步覆盖时直接等它的结果；更宽的窗口等它结束后再自己跑
+_logs_flight_lock = threading.Lock()
+_logs_flight: Optional[dict] = None
 
-        # 2) 再做规范化模糊匹配（兼容空格/连字符）
-        if not label_id:
-            for lb in labels:
-                lb_name = lb.get("name") or ""
-                if _norm_label_name(lb_name) == target_norm:
-                    label_id = lb.get("id")
-                    break
-        # 3) 最后做"包含式"匹配，兼容名称有前后缀
-        if not label_id:
-            for lb in labels:
-                lb_name = lb.get("name") or ""
-                n = _norm_label_name(lb_name)
-                if target_norm in n or n in target_norm:
-                    label_id = lb.get("id")
-                    break
-    except Exception:
-        label_id = None
 
-    msgs = []
-    page_token = None
+def fetch_logs_from_gmail(days: int = 1, max_results: int = 200) -> int:
+    """
+    同步 logs 缓存；并发调用会合并成一次（见 _logs_flight）。返回本次写入的记录数。
+    """
+    global _logs_flight
     while True:
-        remaining = max_results - len(msgs)
-        if remaining <= 0:
-            break
-        # 先按 subject 拉候选，再在 get(full) 里按 labelId 严格过滤。
-        # 这样保留 label 条件，同时规避 list 接口对 label 查询的兼容问题。
-        resp = service.users().messages().list(
-            userId="me",
-            q=q,
-            maxResults=min(100, remaining),
-            pageToken=page_token,
-        ).execute()
-        msgs.extend(resp.get("messages", []) or [])
-        page_token = resp.get("nextPageToken")
-        if not page_token:
-            break
+        with _logs_flight_lock:
+            flight = _logs_flight
+            if flight is None:
+                flight = {
+                    "days": days,
+                    "done": threading.Event(),
+                    "result": None,
+                    "error": None,
+                }
+                _logs_flight = flight
+                break
+        if flight["days"] >= days:
+            flight["done"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["result"]
+        flight["done"].wait()
 
-    cutoff = now_hk() - timedelta(hours=hours)
-    out: List[Dict[str, Any]] = []
-    for msg in msgs:
-        mid = msg.get("id")
-        if not mid:
-            continue
-        detail = service.users().messages().get(userId="me", id=mid, format="full").execute()
-        if label_id:
-            msg_label_ids = detail.get("labelIds", []) or []
-            if label_id not in msg_label_ids:
-                continue
-        payload = detail.get("payload") or {}
-        subject = _safe_header(payload.get("headers") or [], "Subject").strip()
-        if subject_keyword.lower() not in subject.lower():
-            continue
-
-        internal_ms = int(detail.get("internalDate", "0") or "0")
-        ts_dt = datetime.fromtimestamp(internal_ms / 1000, now_hk().tzinfo)
-        if ts_dt < cutoff:
-            continue
-
-        # 提取JSON附件
-        json_data = _extract_json_attachment(service, mid, payload)
-
-        out.append(
-            {
-                "id": mid,
-                "subject": subject,
-                "ts": ts_dt.isoformat(timespec="seconds"),
-                "json_data": json_data,
-            }
-        )
+    try:
+        flight["result"] = _fetch_logs_from_gmail(days, max_results)
+        return flight["result"]
+    except Exception as e:
+        flight["error"] = e
+        raise
+    finally:
+        with _logs_flight_lock:
+            _logs_flight = None
+        flight["done"].set()
+
+
+def _fetch_logs_from_gmail(days: int, max_results: int) -> int:
+    """
+    同步 logs 缓存：
+    - 缓存里有 historyId 游标且已覆盖所需天数：走 history.list 只拉新邮件
+    - 没有游标 / 需要更长时间窗 / 游标过期（404）：按 newer_than 全量重建
+    """
+    service = get_gmail_service()
+    state = get_logs_sync_state()
+    history_id = state.get("history_id")
+    synced_days = int(state.get("synced_days") or 0)
 
-    out.sort(key=lambda x: x.get("ts", ""))
-    return out
\ No newline at end of file
+    if history_id and synced_days >= days:
+        try:
+            return _sync_logs_incremental(service, history_id, synced_days)
+        except HttpError as e:
+            # historyId 过期（通常约一周）时 Gmail 返回 404，需要全量重建
+            if getattr(e.resp, "status", None) != 404:
+                raise
+            print("logs history 游标已过期，改为全量同步")
+
+    return _sync_logs_full(service, days, max_results)
@@ -0,0 +1,151 @@
+import json
+import random
+import threading
+import time
+from typing import Optional
+
+from googleapiclient.errors import HttpError
+
+import config
+from integrations.google_api import _is_retryable_gapi_error
+
+# Gmail 按方法计费的配额单位（https://developers.google.com/gmail/api/reference/quota）
+# batch 请求里的每个子请求单独计费
+GMAIL_QUOTA_COSTS = {
+    "messages.send": 100,
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.attachments.get": 5,
+    "history.list": 2,
+    "labels.list": 1,
+    "getProfile": 1,
+}
+DEFAULT_QUOTA_COST = 5
+
+# 进程内共享的令牌桶：所有线程的 Gmail 调用都从这里扣配额
+_bucket_lock = threading.Lock()
+_tokens: Optional[float] = None
+_last_refill = 0.0
+# 被限流后所有调用一起暂停到这个时间点
+_blocked_until = 0.0
+
+
+def quota_cost(method: str, count: int = 1) -> int:
+    return GMAIL_QUOTA_COSTS.get(method, DEFAULT_QUOTA_COST) * max(1, count)
+
+
+def _refill_locked(now: float, rate: float, capacity: float):
+    global _tokens, _last_refill
+    if _tokens is None:
+        _tokens = capacity
+    else:
+        _tokens = min(capacity, _tokens + (now - _last_refill) * rate)
+    _last_refill = now
+
+
+def acquire_quota(units: int):
+    """
+    阻塞直到令牌桶里有足够配额，然后扣除。
+    单次开销大于桶容量（如整批 batch）时，桶满即放行并记为欠账，后续调用等欠账还清，
+    这样长期平均速率仍不超过 GMAIL_QUOTA_UNITS_PER_SECOND。
+    """
+    global _tokens
+    rate = float(config.GMAIL_QUOTA_UNITS_PER_SECOND)
+    capacity = float(config.GMAIL_QUOTA_BURST_UNITS)
+    need = min(float(units), capacity)
+    while True:
+        with _bucket_lock:
+            now = time.monotonic()
+            _refill_locked(now, rate, capacity)
+            wait = max(0.0, _blocked_until - now)
+            if wait <= 0:
+                if _tokens >= need:
+                    _tokens -= units
+                    return
+                wait = (need - _tokens) / rate
+        time.sleep(wait)
+
+
+def note_rate_limited(delay: float):
+    """被限流：清空令牌并让所有线程暂停 delay 秒。"""
+    global _tokens, _blocked_until
+    with _bucket_lock:
+        now = time.monotonic()
+        _blocked_until = max(_blocked_until, now + delay)
+        if _tokens is not None:
+            _tokens = min(_tokens, 0.0)
+
+
+_RATE_LIMIT_REASONS = ("userRateLimitExceeded", "rateLimitExceeded")
+
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    # Gmail 限流有时返回 429，有时返回 403 + userRateLimitExceeded/rateLimitExceeded。
+    # HttpError.error_details 在响应带 error.details 时只给出 ErrorInfo（RATE_LIMIT_EXCEEDED），
+    # 所以直接解析响应体，error.errors 与 error.details 都检查
+    if not isinstance(e, HttpError):
+        return False
+    status = getattr(e.resp, "status", None)
+    if status == 429:
+        return True
+    if status != 403:
+        return False
+    try:
+        error = (json.loads(e.content.decode("utf-8", errors="ignore")) or {}).get("error") or {}
+    except Exception:
+        return False
+    if not isinstance(error, dict):
+        return False
+    for item in error.get("errors") or []:
+        if isinstance(item, dict) and item.get("reason") in _RATE_LIMIT_REASONS:
+            return True
+    for item in error.get("details") or []:
+        if isinstance(item, dict) and item.get("reason") == "RATE_LIMIT_EXCEEDED":
+            return True
+    return False
+
+
+def _retry_after_seconds(e: Exception) -> Optional[float]:
+    try:
+        value = e.resp.get("retry-after")
+        return float(value) if value else None
+    except Exception:
+        return None
+
+
+def _backoff_seconds(attempt: int, base_sleep: float) -> float:
+    # 指数退避 + 抖动，避免多个线程同时重试
+    return base_sleep * (2 ** (attempt - 1)) * (1 + random.random() * 0.5)
+
+
+def gmail_execute(
+    method: str,
+    fn,
+    *,
+    units: Optional[int] = None,
+    idempotent: bool = True,
+    max_attempts: int = 5,
+    base_sleep: float = 1.0,
+):
+    """
+    按配额限速执行一次 Gmail 调用（fn 内部调用 .execute()），遇到限流/5xx 退避重试。
+    - units: 默认按 GMAIL_QUOTA_COSTS[method] 计费
+    - idempotent=False（如 messages.send）时只在限流错误上重试：5xx 时邮件可能已经发出
+    其他错误原样抛出，调用方照旧按 HttpError 状态码处理。
+    """
+    cost = units if units is not None else quota_cost(method)
+    for attempt in range(1, max_attempts + 1):
+        acquire_quota(cost)
+        try:
+            return fn()
+        except Exception as e:
+            rate_limited = _is_rate_limit_error(e)
+            if attempt >= max_attempts or not (rate_limited or _is_retryable_gapi_error(e)):
+                raise
+            if not idempotent and not rate_limited:
+                raise
+            delay = _retry_after_seconds(e) or _backoff_seconds(attempt, base_sleep)
+            if rate_limited:
+                note_rate_limited(delay)
+            else:
+                time.sleep(delay)
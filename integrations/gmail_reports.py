@@ -0,0 +1,341 @@
+import json
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+import config
+from core.time_utils import now_hk
+from integrations.attachment_cache import get_cached_json, put_cached_json
+from integrations.gmail import (
+    _b64url_decode,
+    _quote_search_value,
+    _safe_header,
+    get_gmail_service,
+)
+from integrations.gmail_quota import gmail_execute
+
+
+def _norm_label_name(name: str) -> str:
+    # 统一：大小写不敏感 + 去空白 + 去连字符，兼容 "AI Logs" / "ai-logs" 等差异
+    return re.sub(r"[\s\-_]+", "", (name or "").strip().lower())
+
+
+# 已解析的报告邮件：message_id -> (source_key, record)。
+# 邮件内容发出后不会变，后台预取和用户导出共用，导出时只需再 list 一次。
+_report_records: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+_report_records_lock = threading.Lock()
+
+# 拉取报告邮件的常驻线程池：线程长期存活，线程本地的 Gmail service/连接可以复用
+_fetch_pool: Optional[ThreadPoolExecutor] = None
+_fetch_pool_size = 0
+_fetch_pool_lock = threading.Lock()
+
+
+def _get_fetch_pool() -> ThreadPoolExecutor:
+    global _fetch_pool, _fetch_pool_size
+    workers = max(1, int(config.REPORT_FETCH_WORKERS or 1))
+    with _fetch_pool_lock:
+        if _fetch_pool is None or _fetch_pool_size != workers:
+            # 配置变了才重建；旧池里正在跑的任务照常完成
+            if _fetch_pool is not None:
+                _fetch_pool.shutdown(wait=False)
+            _fetch_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-fetch")
+            _fetch_pool_size = workers
+        return _fetch_pool
+
+
+# 标签名 -> (label_id, 过期时间戳)；只缓存解析成功的结果
+_label_id_cache: Dict[str, Tuple[str, float]] = {}
+_label_id_lock = threading.Lock()
+
+
+def _find_label_id(service, preferred_label_name: str) -> Optional[str]:
+    target_norm = _norm_label_name(preferred_label_name)
+    try:
+        labels_resp = gmail_execute(
+            "labels.list", lambda: service.users().labels().list(userId="me").execute()
+        )
+        labels = labels_resp.get("labels", []) or []
+    except Exception:
+        return None
+
+    # 1) 优先精确名（忽略大小写）
+    for lb in labels:
+        lb_name = (lb.get("name") or "").strip()
+        if lb_name.lower() == preferred_label_name.lower():
+            return lb.get("id")
+
+    # 2) 再做规范化模糊匹配（兼容空格/连字符）
+    for lb in labels:
+        if _norm_label_name(lb.get("name") or "") == target_norm:
+            return lb.get("id")
+
+    # 3) 最后做"包含式"匹配，兼容名称有前后缀
+    for lb in labels:
+        n = _norm_label_name(lb.get("name") or "")
+        if target_norm in n or n in target_norm:
+            return lb.get("id")
+    return None
+
+
+def _resolve_label_id(service, preferred_label_name: str) -> Optional[str]:
+    """标签名解析为 label id，结果按 GMAIL_LABEL_CACHE_TTL_SECONDS 缓存。"""
+    if not preferred_label_name:
+        return None
+    now = time.time()
+    with _label_id_lock:
+        cached = _label_id_cache.get(preferred_label_name)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    label_id = _find_label_id(service, preferred_label_name)
+    if label_id:
+        with _label_id_lock:
+            _label_id_cache[preferred_label_name] = (
+                label_id,
+                now + config.GMAIL_LABEL_CACHE_TTL_SECONDS,
+            )
+    return label_id
+
+
+def _invalidate_label_id(preferred_label_name: str):
+    with _label_id_lock:
+        _label_id_cache.pop(preferred_label_name, None)
+
+
+def _extract_json_attachment(service, message_id: str, payload: dict) -> Optional[Dict[str, Any]]:
+    """从邮件payload中提取JSON附件并解析"""
+    if not payload:
+        return None
+
+    def _find_json_in_parts(parts: List[dict]) -> Optional[str]:
+        for part in parts:
+            mime = (part.get("mimeType") or "").lower()
+            filename = ""
+            for h in part.get("headers", []):
+                if (h.get("name") or "").lower() == "content-disposition":
+                    cd = h.get("value") or ""
+                    m = re.search(r'filename="?([^"]+)"?', cd, re.IGNORECASE)
+                    if m:
+                        filename = m.group(1)
+                    break
+
+            # 检查是否是JSON附件
+            if filename.lower().endswith(".json") or mime == "application/json":
+                att_id = part.get("body", {}).get("attachmentId")
+                if att_id:
+                    # 附件内容发出后不会再变：先查本地缓存。
+                    # attachmentId 每次 get 都可能不同，缓存 key 用稳定的 partId。
+                    part_key = part.get("partId") or filename
+                    cached = get_cached_json(message_id, part_key)
+                    if cached is not None:
+                        return cached
+                    try:
+                        att_resp = gmail_execute(
+                            "messages.attachments.get",
+                            lambda: service.users().messages().attachments().get(
+                                userId="me", messageId=message_id, id=att_id
+                            ).execute(),
+                        )
+                        att_data = att_resp.get("data", "")
+                        json_str = _b64url_decode(att_data)
+                        data = json.loads(json_str)
+                        put_cached_json(message_id, part_key, data)
+                        return data
+                    except Exception:
+                        pass
+
+            # 递归检查子parts
+            if part.get("parts"):
+                result = _find_json_in_parts(part.get("parts", []))
+                if result:
+                    return result
+        return None
+
+    # 检查顶层是否是multipart
+    mime = (payload.get("mimeType") or "").lower()
+    if mime.startswith("multipart/"):
+        parts = payload.get("parts", [])
+        return _find_json_in_parts(parts)
+    elif mime == "application/json":
+        # 直接是JSON
+        body = payload.get("body", {})
+        data = body.get("data")
+        if data:
+            json_str = _b64url_decode(data)
+            return json.loads(json_str)
+
+    return None
+
+
+def _match_source(subject: str, sources: Dict[str, dict]) -> Optional[str]:
+    s = (subject or "").lower()
+    for key, src in sources.items():
+        if (src.get("subject_keyword") or "").lower() in s:
+            return key
+    return None
+
+
+def _hydrate_report_message(
+    mid: str,
+    *,
+    sources: Dict[str, dict],
+    cutoff: datetime,
+) -> Optional[tuple]:
+    # 在线程池里运行：使用当前工作线程自己的 service
+    service = get_gmail_service()
+    detail = gmail_execute(
+        "messages.get",
+        lambda: service.users().messages().get(userId="me", id=mid, format="full").execute(),
+    )
+    payload = detail.get("payload") or {}
+    subject = _safe_header(payload.get("headers") or [], "Subject").strip()
+    source_key = _match_source(subject, sources)
+    if not source_key:
+        return None
+
+    internal_ms = int(detail.get("internalDate", "0") or "0")
+    ts_dt = datetime.fromtimestamp(internal_ms / 1000, now_hk().tzinfo)
+    if ts_dt < cutoff:
+        return None
+
+    # 提取JSON附件
+    json_data = _extract_json_attachment(service, mid, payload)
+    return source_key, {
+        "id": mid,
+        "subject": subject,
+        "ts": ts_dt.isoformat(timespec="seconds"),
+        "json_data": json_data,
+    }
+
+
+def _list_report_message_ids(service, q: str, label_id: Optional[str], max_results: int) -> List[str]:
+    msgs = []
+    page_token = None
+    while True:
+        remaining = max_results - len(msgs)
+        if remaining <= 0:
+            break
+        kwargs = {"labelIds": [label_id]} if label_id else {}
+        resp = gmail_execute(
+            "messages.list",
+            lambda: service.users().messages().list(
+                userId="me",
+                q=q,
+                maxResults=min(100, remaining),
+                pageToken=page_token,
+                **kwargs,
+            ).execute(),
+        )
+        msgs.extend(resp.get("messages", []) or [])
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            break
+    return [m.get("id") for m in msgs if m.get("id")]
+
+
+def _remember_report_records(records: Dict[str, tuple]) -> None:
+    # 只保留 REPORT_RECORD_CACHE_HOURS 内的邮件，防止常驻内存无限增长
+    oldest = (now_hk() - timedelta(hours=config.REPORT_RECORD_CACHE_HOURS)).isoformat(
+        timespec="seconds"
+    )
+    with _report_records_lock:
+        _report_records.update(records)
+        for mid in [m for m, (_, r) in _report_records.items() if r.get("ts", "") < oldest]:
+            del _report_records[mid]
+
+
+def fetch_report_emails(
+    source_keys: List[str], hours: int = 24, max_results: int = 500
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    按 config.REPORT_SOURCES 拉取批量处理报告邮件及其 JSON 附件。
+    - 多个来源合并为一次 list 查询，再按 subject 关键字分流
+    - get(full) 与附件下载在有界线程池里并发执行；已解析过的邮件直接复用
+    返回 {source_key: [按时间升序的邮件记录]}
+    """
+    sources = {k: config.REPORT_SOURCES[k] for k in source_keys if k in config.REPORT_SOURCES}
+    out: Dict[str, List[Dict[str, Any]]] = {k: [] for k in sources}
+    if not sources:
+        return out
+
+    service = get_gmail_service()
+    days = max(1, math.ceil(hours / 24))
+
+    # 同一标签的来源合并为一次 list 查询；labelIds 交给 Gmail 服务端过滤，
+    # 不带该标签的邮件不会被下载
+    groups: Dict[str, List[dict]] = {}
+    for src in sources.values():
+        groups.setdefault(src.get("label_name") or "", []).append(src)
+
+    msgs = []
+    for label_name, group in groups.items():
+        subject_q = " OR ".join(
+            f"subject:{_quote_search_value(src.get('subject_keyword'))}" for src in group
+        )
+        q = f"({subject_q}) newer_than:{days}d"
+        total_max = max_results * len(group)
+        try:
+            msgs.extend(
+                _list_report_message_ids(
+                    service, q, _resolve_label_id(service, label_name), total_max
+                )
+            )
+        except HttpError as e:
+            # 缓存的 label id 可能已失效（标签被删/改名），重新解析一次
+            if getattr(e.resp, "status", None) not in (400, 404) or not label_name:
+                raise
+            _invalidate_label_id(label_name)
+            msgs.extend(
+                _list_report_message_ids(
+                    service, q, _resolve_label_id(service, label_name), total_max
+                )
+            )
+
+    msg_ids = list(dict.fromkeys(msgs))
+    cutoff = now_hk() - timedelta(hours=hours)
+    cutoff_ts = cutoff.isoformat(timespec="seconds")
+
+    with _report_records_lock:
+        cached = {mid: _report_records[mid] for mid in msg_ids if mid in _report_records}
+    missing = [mid for mid in msg_ids if mid not in cached]
+
+    fetched: Dict[str, tuple] = {}
+    if missing:
+        results = _get_fetch_pool().map(
+            lambda mid: _hydrate_report_message(mid, sources=sources, cutoff=cutoff),
+            missing,
+        )
+        for mid, res in zip(missing, results):
+            if res:
+                fetched[mid] = res
+        # 附件解析失败的不缓存，下次再试
+        _remember_report_records({mid: res for mid, res in fetched.items() if res[1].get("json_data") is not None})
+
+    for mid in msg_ids:
+        res = cached.get(mid) or fetched.get(mid)
+        if not res:
+            continue
+        source_key, record = res
+        if source_key not in out or record.get("ts", "") < cutoff_ts:
+            continue
+        if len(out[source_key]) < max_results:
+            out[source_key].append(record)
+
+    for records in out.values():
+        records.sort(key=lambda x: x.get("ts", ""))
+    return out
+
+
+def fetch_rthk_emails_for_excel(hours: int = 24, max_results: int = 500) -> List[Dict[str, Any]]:
+    return fetch_report_emails(["rthk"], hours, max_results).get("rthk") or []
+
+
+def fetch_dotdot_emails_for_excel(hours: int = 24, max_results: int = 500) -> List[Dict[str, Any]]:
+    return fetch_report_emails(["dotdot"], hours, max_results).get("dotdot") or []
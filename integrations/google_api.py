@@ -0,0 +1,97 @@
+import json
+import threading
+from typing import Dict, Tuple
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+
+from integrations.google_auth import get_google_creds
+
+# 本 Bot 用到的 API（预加载 discovery 文档）
+PRELOAD_APIS = (("gmail", "v1"), ("drive", "v3"))
+
+HTTP_TIMEOUT_SECONDS = 120
+
+# discovery 文档：从 google-api-python-client 自带的静态文件读取，进程内只解析一次
+_discovery_docs: Dict[Tuple[str, str], dict] = {}
+_discovery_lock = threading.Lock()
+
+# httplib2.Http 不是线程安全的：每个工作线程持有自己的 service + keep-alive 连接
+_thread_local = threading.local()
+_build_lock = threading.Lock()
+
+
+def _format_gapi_error(e: Exception) -> str:
+    if isinstance(e, HttpError):
+        try:
+            payload = json.loads(e.content.decode("utf-8", errors="ignore"))
+            msg = payload.get("error", {}).get("message") or str(e)
+        except Exception:
+            msg = str(e)
+        return f"HTTP {getattr(e.resp, 'status', 'unknown')}: {msg}"
+    return str(e)
+
+
+def _is_retryable_gapi_error(e: Exception) -> bool:
+    if isinstance(e, HttpError):
+        status = getattr(e.resp, "status", None)
+        if status in (429, 500, 502, 503, 504):
+            return True
+        try:
+            payload = json.loads(e.content.decode("utf-8", errors="ignore"))
+            msg = (payload.get("error", {}).get("message") or "").lower()
+            if "transient" in msg or "backend error" in msg:
+                return True
+        except Exception:
+            pass
+    return False
+
+
+def _get_discovery_doc(api: str, version: str) -> dict:
+    key = (api, version)
+    doc = _discovery_docs.get(key)
+    if doc is not None:
+        return doc
+    with _discovery_lock:
+        doc = _discovery_docs.get(key)
+        if doc is None:
+            raw = get_static_doc(api, version)
+            if not raw:
+                raise RuntimeError(f"找不到 {api} {version} 的静态 discovery 文档")
+            doc = json.loads(raw)
+            _discovery_docs[key] = doc
+    return doc
+
+
+def preload_discovery_docs():
+    for api, version in PRELOAD_APIS:
+        try:
+            _get_discovery_doc(api, version)
+        except Exception as e:
+            print(f"预加载 discovery 文档失败: {api} {version}, {e}")
+
+
+def get_service(api: str, version: str):
+    """
+    返回当前线程专用的 Google API service。
+    同一线程内重复调用复用同一个 service 和底层连接；凭证对象变了才重建。
+    """
+    services = getattr(_thread_local, "services", None)
+    if services is None:
+        services = {}
+        _thread_local.services = services
+
+    creds = get_google_creds()
+    cached = services.get((api, version))
+    if cached is not None and cached[0] is creds:
+        return cached[1]
+
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS))
+    # build_from_document 会往文档里补默认参数，串行化避免多线程同时改同一个 dict
+    with _build_lock:
+        service = build_from_document(_get_discovery_doc(api, version), http=http)
+    services[(api, version)] = (creds, service)
+    return service
@@ -0,0 +1,93 @@
+import os
+import pickle
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from google.auth.transport.requests import Request
+from google_auth_oauthlib.flow import InstalledAppFlow
+
+import config
+
+TOKEN_PATH = "token.pickle"
+CLIENT_SECRETS_PATH = "credentials.json"
+
+# 提前刷新：access token 剩余有效期少于这个值就刷新
+REFRESH_AHEAD_SECONDS = 5 * 60
+
+# 进程内凭证：只从磁盘加载一次，之后在内存中刷新
+_creds = None
+_creds_loaded = False
+# 同一时间只允许一个线程加载/刷新，其余线程等待并复用结果
+_creds_lock = threading.Lock()
+
+
+def _load_token_file():
+    if not os.path.exists(TOKEN_PATH):
+        return None
+    try:
+        with open(TOKEN_PATH, "rb") as token:
+            return pickle.load(token)
+    except Exception as e:
+        print(f"读取 {TOKEN_PATH} 失败: {e}")
+        return None
+
+
+def _save_token_file(creds) -> None:
+    """原子写入：先写临时文件再 os.replace，避免并发/中断留下半截文件。"""
+    token_dir = os.path.dirname(os.path.abspath(TOKEN_PATH))
+    fd, tmp_path = tempfile.mkstemp(prefix=".token.", suffix=".tmp", dir=token_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(creds, f)
+        os.replace(tmp_path, TOKEN_PATH)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+        raise
+
+
+def _needs_refresh(creds) -> bool:
+    if not creds.valid:
+        return True
+    expiry = getattr(creds, "expiry", None)
+    if not expiry:
+        return False
+    # google-auth 的 expiry 是 naive UTC
+    return expiry - datetime.utcnow() < timedelta(seconds=REFRESH_AHEAD_SECONDS)
+
+
+def get_google_creds():
+    global _creds, _creds_loaded
+
+    creds = _creds
+    if creds is not None and not _needs_refresh(creds):
+        return creds
+
+    with _creds_lock:
+        # 等锁期间可能已经有其他线程刷新完成
+        if not _creds_loaded:
+            _creds = _load_token_file()
+            _creds_loaded = True
+        creds = _creds
+        if creds is not None and not _needs_refresh(creds):
+            return creds
+
+        if creds and creds.refresh_token:
+            try:
+                creds.refresh(Request())
+            except Exception:
+                # 提前刷新失败但 token 仍有效时先继续用，下次调用再试
+                if creds.valid:
+                    return creds
+                raise
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(
+                CLIENT_SECRETS_PATH, config.SCOPES
+            )
+            creds = flow.run_local_server(port=0, access_type="offline", prompt="consent")
+        _save_token_file(creds)
+        _creds = creds
+        return creds
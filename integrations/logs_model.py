@@ -0,0 +1,238 @@
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Tuple
+
+from integrations.logs_store import get_logs_meta, load_logs_since
+
+# 常驻内存的 logs 模型：启动时加载一次，之后只在 store 的 version 变化时
+# 按 seq 增量合并新写入的行。翻页/详情都直接读内存。
+_model_lock = threading.Lock()
+_version: Optional[int] = None
+_meta: Dict[str, Any] = {}
+_records: Dict[str, Dict[str, Any]] = {}
+# dedup_key -> id，与 store 的去重规则保持一致
+_id_by_key: Dict[str, str] = {}
+# 按时间倒序排好的记录列表（只在变化时重建）
+_sorted: List[Dict[str, Any]] = []
+
+# 预建索引（随 version 重建）：
+# - 每个状态一个桶（ALL/SUCCESS/ERROR），桶内按时间倒序，附带取负的 epoch 数组
+#   供 bisect 按天数截断，以及成功/失败前缀计数，计数只需查表
+# - 关键字筛选结果按 (version, mode, keyword) 缓存，天数同样用 bisect 截断
+_buckets: Dict[str, Dict[str, Any]] = {}
+
+# 关键字倒排索引（随写入增量维护）：标题多为繁体中文，不分词，
+# 对 "title subject" 的小写文本取单字 + 相邻二字（bigram）建 posting
+_haystacks: Dict[str, str] = {}
+_postings: Dict[str, set] = {}
+_view_cache: "OrderedDict[Tuple[int, str, str], Dict[str, Any]]" = OrderedDict()
+VIEW_CACHE_SIZE = 32
+
+
+def _haystack(record: Dict[str, Any]) -> str:
+    return f"{record.get('title') or ''} {record.get('subject') or ''}".lower()
+
+
+def _grams(text: str) -> set:
+    grams = set(text)
+    grams.update(text[i : i + 2] for i in range(len(text) - 1))
+    grams.discard(" ")
+    return grams
+
+
+def _index_text_locked(log_id: str, text: str) -> None:
+    _haystacks[log_id] = text
+    for g in _grams(text):
+        _postings.setdefault(g, set()).add(log_id)
+
+
+def _unindex_text_locked(log_id: str) -> None:
+    text = _haystacks.pop(log_id, None)
+    if text is None:
+        return
+    for g in _grams(text):
+        ids = _postings.get(g)
+        if ids is None:
+            continue
+        ids.discard(log_id)
+        if not ids:
+            del _postings[g]
+
+
+def _remove_record_locked(log_id: str) -> None:
+    _records.pop(log_id, None)
+    _unindex_text_locked(log_id)
+
+
+def _apply_rows_locked(rows: List[Dict[str, Any]]) -> None:
+    for row in rows:
+        log_id = row["id"]
+        key = row.pop("dedup_key", None) or log_id
+        old = _records.get(log_id)
+        if old is not None:
+            old_key = old.get("gmail_id") or log_id
+            if _id_by_key.get(old_key) == log_id:
+                _id_by_key.pop(old_key, None)
+        # store 写入时会删掉同 dedup_key 的旧行
+        replaced = _id_by_key.get(key)
+        if replaced and replaced != log_id:
+            _remove_record_locked(replaced)
+        text = _haystack(row)
+        if _haystacks.get(log_id) != text:
+            _unindex_text_locked(log_id)
+            _index_text_locked(log_id, text)
+        _records[log_id] = row
+        _id_by_key[key] = log_id
+
+
+def _build_bucket(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "records": records,
+        "neg_epochs": [-(r.get("ts_epoch") or 0) for r in records],
+        "succ_prefix": [0]
+        + list(accumulate(1 if r.get("status") == "SUCCESS" else 0 for r in records)),
+        "fail_prefix": [0]
+        + list(accumulate(1 if r.get("status") == "ERROR" else 0 for r in records)),
+    }
+
+
+def _rebuild_index_locked() -> None:
+    global _buckets
+    _buckets = {
+        "ALL": _build_bucket(_sorted),
+        "SUCCESS": _build_bucket([r for r in _sorted if r.get("status") == "SUCCESS"]),
+        "ERROR": _build_bucket([r for r in _sorted if r.get("status") == "ERROR"]),
+    }
+    _view_cache.clear()
+
+
+def _match_ids_locked(keyword: str) -> set:
+    """倒排表求交集得到候选，再做一次子串校验去掉 bigram 拼凑出来的误命中。"""
+    grams = _grams(keyword)
+    if len(keyword) > 1:
+        # 有 bigram 时只用 bigram：比单字 posting 短得多
+        grams = {g for g in grams if len(g) == 2} or grams
+    if not grams:
+        return set()
+    postings = sorted((_postings.get(g) or set() for g in grams), key=len)
+    if not postings[0]:
+        return set()
+    candidates = set(postings[0])
+    for ids in postings[1:]:
+        candidates &= ids
+        if not candidates:
+            return candidates
+    return {i for i in candidates if keyword in _haystacks.get(i, "")}
+
+
+def _match_score(record: Dict[str, Any], keyword: str) -> int:
+    # 排序：标题以关键字开头 > 标题包含 > 只有 subject 包含
+    title = (record.get("title") or "").lower()
+    if title.startswith(keyword):
+        return 2
+    if keyword in title:
+        return 1
+    return 0
+
+
+def refresh_logs_model() -> int:
+    """store 有新写入时增量更新内存模型，返回当前 version。"""
+    global _version, _meta, _sorted
+    meta = get_logs_meta()
+    version = meta.get("version") or 0
+    if version == _version:
+        return version
+    with _model_lock:
+        if version == _version:
+            return version
+        rows = load_logs_since(_version or 0)
+        _apply_rows_locked(rows)
+        if rows or _version is None:
+            _sorted = sorted(
+                _records.values(),
+                key=lambda r: (r.get("ts_epoch") or 0, r.get("id") or ""),
+                reverse=True,
+            )
+            _rebuild_index_locked()
+        _meta = meta
+        _version = version
+    return version
+
+
+def get_logs_snapshot() -> Tuple[int, List[Dict[str, Any]], Dict[str, Any]]:
+    """返回 (version, 按时间倒序的记录列表, store meta)；列表只读，不要原地修改。"""
+    refresh_logs_model()
+    with _model_lock:
+        return _version or 0, _sorted, _meta
+
+
+def _get_bucket_locked(mode: str, keyword: str) -> Dict[str, Any]:
+    base = _buckets.get(mode) or _buckets.get("ALL") or _build_bucket([])
+    if not keyword:
+        return base
+    key = (_version or 0, mode, keyword)
+    bucket = _view_cache.get(key)
+    if bucket is None:
+        records = [_records[i] for i in _match_ids_locked(keyword) if i in _records]
+        if mode in ("SUCCESS", "ERROR"):
+            records = [r for r in records if r.get("status") == mode]
+        records.sort(key=lambda r: (r.get("ts_epoch") or 0, r.get("id") or ""), reverse=True)
+        bucket = _build_bucket(records)
+        bucket["scores"] = [_match_score(r, keyword) for r in records]
+        # end -> 按相关度排序后的记录（同分保持时间倒序）
+        bucket["ranked"] = {}
+        _view_cache[key] = bucket
+        while len(_view_cache) > VIEW_CACHE_SIZE:
+            _view_cache.popitem(last=False)
+    else:
+        _view_cache.move_to_end(key)
+    return bucket
+
+
+def query_logs_view(
+    *,
+    since_epoch: int,
+    mode: str = "ALL",
+    keyword: str = "",
+    offset: int = 0,
+    limit: int = 8,
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    按 (天数截断, 状态, 关键字) 取一页记录和计数，返回 (items, {"total","succ","fail"})。
+    无关键字时按时间倒序；有关键字时按相关度排序。keyword 需已转为小写。
+    """
+    refresh_logs_model()
+    with _model_lock:
+        bucket = _get_bucket_locked(mode, keyword)
+        # 桶内取负 epoch 升序：前 end 条即 ts_epoch >= since_epoch 的记录
+        end = bisect_right(bucket["neg_epochs"], -since_epoch)
+        records = bucket["records"]
+        if keyword:
+            ranked = bucket["ranked"].get(end)
+            if ranked is None:
+                scores = bucket["scores"]
+                order = sorted(range(end), key=lambda i: -scores[i])
+                ranked = [records[i] for i in order]
+                bucket["ranked"][end] = ranked
+            records = ranked
+    counts = {
+        "total": end,
+        "succ": bucket["succ_prefix"][end],
+        "fail": bucket["fail_prefix"][end],
+    }
+    start = max(0, offset)
+    return records[start : min(end, start + limit)], counts
+
+
+def get_log_record(log_id: str) -> Optional[Dict[str, Any]]:
+    refresh_logs_model()
+    return _records.get(str(log_id))
+
+
+def preload_logs_model() -> None:
+    try:
+        refresh_logs_model()
+    except Exception as e:
+        print(f"预加载 logs 失败: {e}")
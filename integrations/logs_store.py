@@ -0,0 +1,255 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import config
+
+# logs 缓存：SQLite（WAL）。按邮件 id upsert，不再每次整份读写 JSON；
+# 界面读取走 logs_model 的内存副本。
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id TEXT PRIMARY KEY,
+    dedup_key TEXT NOT NULL UNIQUE,
+    ts TEXT NOT NULL,
+    ts_epoch INTEGER NOT NULL,
+    status TEXT,
+    error_code INTEGER,
+    title TEXT,
+    short_title TEXT,
+    subject TEXT,
+    gmail_id TEXT,
+    original_subject TEXT,
+    body_fetched INTEGER NOT NULL DEFAULT 0,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs (ts_epoch DESC);
+CREATE INDEX IF NOT EXISTS idx_logs_status_ts ON logs (status, ts_epoch DESC);
+CREATE INDEX IF NOT EXISTS idx_logs_error_code ON logs (error_code);
+CREATE INDEX IF NOT EXISTS idx_logs_seq ON logs (seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_COLUMNS = (
+    "id",
+    "ts",
+    "status",
+    "error_code",
+    "title",
+    "short_title",
+    "subject",
+    "gmail_id",
+    "original_subject",
+    "body_fetched",
+)
+
+# 列表刷新只有 metadata，不要覆盖详情页按需拉正文补全的字段
+_BODY_FIELDS = ("gmail_id", "original_subject", "title", "short_title", "body_fetched")
+
+# sqlite3 连接不能跨线程共享：每个线程一个连接
+_thread_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_path: Optional[str] = None
+# 写入串行化（WAL 下读不阻塞写）
+_write_lock = threading.Lock()
+
+
+def _ts_to_epoch(ts: str) -> int:
+    try:
+        return int(datetime.fromisoformat(ts).timestamp())
+    except Exception:
+        return 0
+
+
+def _open_connection(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _initialized_path
+    path = config.LOGS_DB_PATH
+    conn = getattr(_thread_local, "conn", None)
+    if conn is not None and getattr(_thread_local, "path", None) == path:
+        return conn
+
+    if _initialized_path != path:
+        with _init_lock:
+            if _initialized_path != path:
+                init_conn = _open_connection(path)
+                try:
+                    _ensure_seq_column(init_conn)
+                    init_conn.executescript(SCHEMA)
+                    _migrate_json_cache(init_conn)
+                finally:
+                    init_conn.close()
+                _initialized_path = path
+
+    conn = _open_connection(path)
+    _thread_local.conn = conn
+    _thread_local.path = path
+    return conn
+
+
+def _ensure_seq_column(conn: sqlite3.Connection) -> None:
+    # 早期版本的表没有 seq 列：补上，并把旧行回填为一个新 version，
+    # 否则 seq=0 的旧行永远不会被 load_logs_since(0) 读到
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(logs)").fetchall()]
+    if cols and "seq" not in cols:
+        with conn:
+            conn.execute("ALTER TABLE logs ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            version = _bump_version_locked(conn)
+            conn.execute("UPDATE logs SET seq = ?", (version,))
+
+
+def _row_to_record(row: sqlite3.Row) -> Dict[str, Any]:
+    record = {k: row[k] for k in _COLUMNS}
+    record["body_fetched"] = bool(record["body_fetched"])
+    return record
+
+
+def _get_meta(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value) -> None:
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, None if value is None else str(value)),
+    )
+
+
+def _merge_log_record(old: Optional[dict], new: dict) -> dict:
+    if (
+        old
+        and old.get("id") == new.get("id")
+        and old.get("body_fetched")
+        and not new.get("body_fetched")
+    ):
+        merged = dict(new)
+        for f in _BODY_FIELDS:
+            merged[f] = old.get(f)
+        return merged
+    return new
+
+
+def _upsert_locked(conn: sqlite3.Connection, items: list, seq: int) -> None:
+    for it in items:
+        log_id = it.get("id")
+        # 同一封源邮件可能有多条 log：按 Gmail ID 去重，只保留最新写入的那条
+        key = it.get("gmail_id") or log_id
+        if not log_id or not key:
+            continue
+        row = conn.execute("SELECT * FROM logs WHERE id = ?", (log_id,)).fetchone()
+        record = _merge_log_record(_row_to_record(row) if row else None, it)
+        key = record.get("gmail_id") or log_id
+        conn.execute("DELETE FROM logs WHERE id = ? OR dedup_key = ?", (log_id, key))
+        conn.execute(
+            "INSERT INTO logs (id, dedup_key, ts, ts_epoch, status, error_code, title, "
+            "short_title, subject, gmail_id, original_subject, body_fetched, seq) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                log_id,
+                key,
+                record.get("ts") or "",
+                _ts_to_epoch(record.get("ts") or ""),
+                record.get("status"),
+                record.get("error_code"),
+                record.get("title"),
+                record.get("short_title"),
+                record.get("subject"),
+                record.get("gmail_id"),
+                record.get("original_subject"),
+                1 if record.get("body_fetched") else 0,
+                seq,
+            ),
+        )
+
+
+def _bump_version_locked(conn: sqlite3.Connection) -> int:
+    # 每次写入 version+1，本次写入的行 seq=version，供内存模型增量加载
+    version = int(_get_meta(conn, "version") or 0) + 1
+    _set_meta(conn, "version", version)
+    return version
+
+
+def _migrate_json_cache(conn: sqlite3.Connection) -> None:
+    """旧版 logs_cache.json 一次性导入；导入后改名保留，不再读取。"""
+    path = config.LOGS_CACHE_PATH
+    if not path or not os.path.exists(path):
+        return
+    if conn.execute("SELECT 1 FROM logs LIMIT 1").fetchone():
+        return
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {"items": data}
+        items = data.get("items") if isinstance(data, dict) else None
+        # 旧文件按时间倒序保存：倒过来写，保持“后写入者胜出”的去重语义
+        with conn:
+            version = _bump_version_locked(conn)
+            _upsert_locked(conn, list(reversed(items or [])), version)
+            _set_meta(conn, "history_id", data.get("history_id"))
+            _set_meta(conn, "synced_days", data.get("synced_days") or 0)
+            _set_meta(conn, "last_refresh", int(os.path.getmtime(path)))
+        os.replace(path, f"{path}.migrated")
+        print(f"已将 {path} 迁移到 {config.LOGS_DB_PATH}")
+    except Exception as e:
+        print(f"迁移 logs 缓存失败: {e}")
+
+
+def upsert_logs(items: list, *, sync_state: Optional[dict] = None) -> None:
+    """按邮件 id 写入/更新 logs；sync_state 不为空时同时写同步游标与刷新时间。"""
+    conn = _get_conn()
+    with _write_lock, conn:
+        version = _bump_version_locked(conn)
+        _upsert_locked(conn, items or [], version)
+        if sync_state:
+            for k, v in sync_state.items():
+                _set_meta(conn, k, v)
+            _set_meta(conn, "last_refresh", int(time.time()))
+
+
+def get_logs_meta() -> Dict[str, Any]:
+    conn = _get_conn()
+    rows = conn.execute("SELECT key, value FROM meta").fetchall()
+    meta = {r["key"]: r["value"] for r in rows}
+    last_refresh = meta.get("last_refresh")
+    return {
+        "history_id": meta.get("history_id") or None,
+        "synced_days": int(meta.get("synced_days") or 0),
+        "last_refresh": int(last_refresh) if last_refresh else None,
+        "version": int(meta.get("version") or 0),
+    }
+
+
+def get_log(log_id: str) -> Optional[Dict[str, Any]]:
+    row = _get_conn().execute("SELECT * FROM logs WHERE id = ?", (str(log_id),)).fetchone()
+    return _row_to_record(row) if row else None
+
+
+def load_logs_since(seq: int) -> List[Dict[str, Any]]:
+    """读取 seq 大于给定值的行（带 ts_epoch/dedup_key/seq），供内存模型增量更新。"""
+    rows = _get_conn().execute(
+        "SELECT * FROM logs WHERE seq > ? ORDER BY seq", (int(seq),)
+    ).fetchall()
+    out = []
+    for r in rows:
+        record = _row_to_record(r)
+        record["ts_epoch"] = r["ts_epoch"]
+        record["dedup_key"] = r["dedup_key"]
+        out.append(record)
+    return out
@@ -0,0 +1,124 @@
+import base64
+import tempfile
+import uuid
+from email import policy
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from googleapiclient.http import MediaIoBaseUpload
+
+import config
+from integrations.gmail_quota import gmail_execute
+
+_MB = 1024 * 1024
+
+# RFC 5322 要求 CRLF 换行
+_CRLF_POLICY = policy.compat32.clone(linesep="\r\n")
+
+# 57 字节正好编码成一行 76 个 base64 字符；按其整数倍分块读取
+_B64_READ_CHUNK = 57 * 1024
+
+# 附件来源：文件路径（流式读取）或内存中的小块 bytes
+AttachmentSource = Union[str, bytes]
+
+
+def _write_base64(out: BinaryIO, src: BinaryIO):
+    while True:
+        chunk = src.read(_B64_READ_CHUNK)
+        if not chunk:
+            break
+        out.write(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+
+
+def _attachment_headers(filename: str) -> bytes:
+    part = MIMEBase("application", "octet-stream")
+    part["Content-Transfer-Encoding"] = "base64"
+    part.add_header("Content-Disposition", "attachment", filename=filename)
+    # 没有 payload 时只输出头部和空行，正文由 _write_base64 流式写入
+    return part.as_bytes(policy=_CRLF_POLICY)
+
+
+def build_mime_stream(
+    *,
+    to: str,
+    subject: str,
+    plain_body: str,
+    html_body: str,
+    attachments: List[Tuple[AttachmentSource, str]],
+    message_id: Optional[str] = None,
+) -> Tuple[BinaryIO, int]:
+    """
+    以流的方式组装 multipart/mixed 邮件（RFC 822 原文），返回 (文件对象, 字节数)。
+    附件逐块读取并 base64 编码写入临时文件，内存占用与附件大小无关。
+    attachments: [(文件路径或 bytes, Content-Disposition 里的 filename)]
+    """
+    boundary = f"=============={uuid.uuid4().hex}=="
+    out = tempfile.SpooledTemporaryFile(max_size=_MB)
+    try:
+        # 头部交给 email 库折行/编码（非 ASCII 的 Subject 会按 RFC 2047 编码）
+        out.write(_CRLF_POLICY.fold_binary("To", to))
+        out.write(_CRLF_POLICY.fold_binary("Subject", subject))
+        if message_id:
+            out.write(_CRLF_POLICY.fold_binary("Message-ID", message_id))
+        out.write(
+            (
+                "MIME-Version: 1.0\r\n"
+                f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n'
+                "\r\n"
+            ).encode("ascii")
+        )
+        delimiter = f"--{boundary}\r\n".encode("ascii")
+
+        alt = MIMEMultipart("alternative")
+        alt.attach(MIMEText(plain_body, "plain", "utf-8"))
+        alt.attach(MIMEText(html_body, "html", "utf-8"))
+        out.write(delimiter)
+        out.write(alt.as_bytes(policy=_CRLF_POLICY))
+        out.write(b"\r\n")
+
+        for source, filename in attachments:
+            if isinstance(source, (bytes, bytearray)):
+                out.write(delimiter)
+                out.write(_attachment_headers(filename))
+                out.write(base64.encodebytes(bytes(source)).replace(b"\n", b"\r\n"))
+                continue
+            try:
+                src = open(source, "rb")
+            except Exception as e:
+                print(f"无法读取文件: {filename}, {e}")
+                continue
+            with src:
+                out.write(delimiter)
+                out.write(_attachment_headers(filename))
+                _write_base64(out, src)
+
+        out.write(f"--{boundary}--\r\n".encode("ascii"))
+        size = out.tell()
+        out.seek(0)
+        return out, size
+    except Exception:
+        out.close()
+        raise
+
+
+def send_mime_stream(service, stream: BinaryIO, size: int):
+    """
+    通过 Gmail media upload 端点发送 RFC 822 原文，避免整封邮件再做一次 base64。
+    超过 GMAIL_RESUMABLE_THRESHOLD_MB 的邮件走分块 resumable 上传。
+    """
+    resumable = size > config.GMAIL_RESUMABLE_THRESHOLD_MB * _MB
+
+    def _send():
+        # 限流重试时从头重新上传
+        stream.seek(0)
+        media = MediaIoBaseUpload(
+            stream,
+            mimetype="message/rfc822",
+            chunksize=config.GMAIL_UPLOAD_CHUNK_MB * _MB,
+            resumable=resumable,
+        )
+        return service.users().messages().send(userId="me", media_body=media).execute()
+
+    return gmail_execute("messages.send", _send, idempotent=False)
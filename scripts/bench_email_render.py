@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import argparse
+import html
+import os
+import re
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import markdown
+
+from integrations.email_render import _render_uncached, clear_render_cache, render_pr_body_html
+
+
+def _legacy_render(pr_body_text: str) -> str:
+    """旧实现：每次新建 markdown 管线、现场编译正则。"""
+    raw = (pr_body_text or "").strip()
+    raw = re.sub(r"(?<!\*)\*([^*\n]+?)\*(?!\*)", r"**\1**", raw)
+    safe_markdown = html.escape(raw, quote=False)
+    return markdown.markdown(safe_markdown, extensions=["extra", "sane_lists", "nl2br"])
+
+
+def _sample_press_release(paragraphs: int) -> str:
+    lines = ["即時發放", "2026年10月17日", "", "*香港創科發展新措施公布*", ""]
+    for i in range(paragraphs):
+        lines.append(
+            f"第{i + 1}段：政府今日公布一系列*重點措施*，涵蓋創新科技、青年發展及醫療服務，"
+            "預計於未來三年內分階段推行，並會與業界及持份者保持緊密溝通。"
+        )
+        if i % 5 == 0:
+            lines.extend(["", "- 措施一：資助計劃", "- 措施二：人才培訓", "- 措施三：基建配套", ""])
+    lines.extend(["", "傳媒查詢：", "電話：1234 5678"])
+    return "\n".join(lines)
+
+
+def _bench(fn, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare old/new press-release email body render time.")
+    parser.add_argument("--paragraphs", type=int, default=200, help="paragraph count of the sample text")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    text = _sample_press_release(args.paragraphs)
+    if _legacy_render(text) != _render_uncached(text, None):
+        print("WARNING: new renderer output differs from legacy output")
+
+    legacy_ms = _bench(lambda: _legacy_render(text), args.rounds)
+    reuse_ms = _bench(lambda: _render_uncached(text, None), args.rounds)
+
+    clear_render_cache()
+    render_pr_body_html(text)
+    cached_ms = _bench(lambda: render_pr_body_html(text), args.rounds)
+
+    print(f"sample: {len(text)} chars, {args.paragraphs} paragraphs, {args.rounds} rounds")
+    print(f"legacy (new pipeline per call): {legacy_ms:8.3f} ms/render")
+    print(f"reused Markdown instance:       {reuse_ms:8.3f} ms/render")
+    print(f"memoised (cache hit):           {cached_ms:8.3f} ms/render")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
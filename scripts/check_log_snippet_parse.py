@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from integrations.gmail import _build_log_record, _extract_fields_from_snippet, log_record_needs_body
+
+# (snippet, 期望 gmail_id, 期望 original_subject, 期望 complete)
+# snippet 形状取自真实 log 邮件：换行被压成空格，约 200 字处截断
+CASES = [
+    (
+        "Gmail ID: 18c9a1b2c3d4e5f6 Original Subject: 新稿件: 政府公告 Error: 沒有找到附件 "
+        "Processed at: 2026-10-16 10:00",
+        "18c9a1b2c3d4e5f6",
+        "新稿件: 政府公告",
+        True,
+    ),
+    (
+        "Status: ERROR Original Subject: 新稿件: 政府公告 Processed at: 2026-10-16 10:00 Gmail ID: 18c9a1b2",
+        "18c9a1b2",
+        "新稿件: 政府公告",
+        False,
+    ),
+    (
+        "Gmail ID: 18c9a1b2c3d4e5f6 Original Subject: 新稿件(Drive): 香港創科發展新措施公布…",
+        "18c9a1b2c3d4e5f6",
+        "新稿件(Drive): 香港創科發展新措施公布…",
+        False,
+    ),
+    (
+        "Gmail ID: 18c9a1b2c3d4e5f6 Original Subject: 新稿件: 政府公告很長的標題被截",
+        "18c9a1b2c3d4e5f6",
+        "新稿件: 政府公告很長的標題被截",
+        False,
+    ),
+]
+
+
+def _detail(snippet: str) -> dict:
+    return {
+        "id": "msg1",
+        "internalDate": "1792112400000",
+        "snippet": snippet,
+        "payload": {"headers": [{"name": "Subject", "value": "[ERROR] 500 公關稿處理失敗"}]},
+    }
+
+
+def main() -> int:
+    failures = 0
+    for snippet, want_id, want_subject, want_complete in CASES:
+        got = _extract_fields_from_snippet(snippet)
+        if got != (want_id, want_subject, want_complete):
+            failures += 1
+            print(f"FAIL parse: {snippet!r}\n  got      {got}\n  expected {(want_id, want_subject, want_complete)}")
+            continue
+        record = _build_log_record(_detail(snippet))
+        if record is None:
+            failures += 1
+            print(f"FAIL record: {snippet!r} produced no log record")
+            continue
+        # 不完整的 snippet：不能写 gmail_id（去重键），详情页必须拉正文
+        if not want_complete and (record.get("gmail_id") or not log_record_needs_body(record)):
+            failures += 1
+            print(f"FAIL provisional: {snippet!r}\n  record {record}")
+        if want_complete and (record.get("gmail_id") != want_id or log_record_needs_body(record)):
+            failures += 1
+            print(f"FAIL complete: {snippet!r}\n  record {record}")
+    print(f"{len(CASES) - failures}/{len(CASES)} snippet cases OK" if not failures else f"{failures} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())